@@ -5,12 +5,21 @@ import numpy as np
 import os
 import platform
 import itertools
+import time
+from types import SimpleNamespace
 from backtesting import Backtest
 
 # --- IMPORTY PROJEKTU ---
 try:
     from strategies import Strategy2xRSI_Dorsey
-    from data_loader import prepare_data_with_indicators
+    from data_loader import prepare_data_with_indicators, has_intrabar
+    from robustness import make_mc_equity_score, rerank_top
+    from splits import DayIndex, make_splits, cpcv_paths
+    from distributed import DirQueue, submit_grid, collect, best_params, start_local_workers
+    from shared_data import SharedGridPool
+    from checkpoints import WFOCheckpoint, stats_dict
+    from day_cube import DayCube
+    from costs import cost_scenarios, reprice
 except ImportError as e:
     print(f"❌ BŁĄD IMPORTU: {e}")
     print("Upewnij się, że pliki strategies.py i data_loader.py są w tym samym folderze.")
@@ -22,6 +31,16 @@ LTF = '2min'
 HTF_RES = '1h'     
 PROWIZJA = 0.000008
 KAPITAL_POCZATKOWY = 10000
+INTRABAR = False   # True: SL/TP w jednej świecy rozstrzygane na danych 1-min (zmienia wyniki)
+MC_OBJECTIVE = False  # True: wybór parametrów wg 5. percentyla kapitału z bootstrapu transakcji
+WFO_SCHEME = 'rolling'  # 'rolling' / 'anchored' / 'cpcv' (combinatorial purged CV)
+QUEUE_DIR = None        # Katalog kolejki (np. dysk sieciowy) -> tryb rozproszony; workery: python distributed.py <QUEUE_DIR>
+LOCAL_WORKERS = 0       # Ile workerów uruchomić dodatkowo na tej maszynie (tryb rozproszony)
+CHECKPOINT_DIR = "wfo_checkpoints"  # Artefakty okien (parametry, statystyki IS/OOS, transakcje); None = bez zapisu
+POOL_WORKERS = 0        # >0: ręczna siatka w N procesach, dane raz we wspólnej pamięci (bezpieczne też na Windows/spawn)
+COST_COMMISSIONS = [PROWIZJA, 0.00002, 0.00005]  # Koszty co-jeśli na transakcjach OOS (costs.py)
+COST_SPREADS = [0.0, 0.00005]
+COST_SLIPPAGES = [0.0, 0.00002]
 
 # Wykrywanie Systemu
 SYSTEM_OPERACYJNY = platform.system() # 'Windows', 'Linux', 'Darwin' (Mac)
@@ -45,9 +64,10 @@ def find_data_file(filename):
         if os.path.exists(path): return path
     return None
 
-def manual_optimization_windows(bt_instance, param_grid):
+def manual_optimization_windows(bt_instance, param_grid, maximize='Equity Final [$]'):
     """
     WINDOWS ONLY: Ręczna, bezpieczna pętla bez multiprocessingu.
+    maximize: nazwa kolumny statystyk lub funkcja stats -> float (jak w bt.optimize).
     """
     keys, values = zip(*param_grid.items())
     combinations = [dict(zip(keys, v)) for v in itertools.product(*values)]
@@ -59,7 +79,7 @@ def manual_optimization_windows(bt_instance, param_grid):
     for params in combinations:
         try:
             stats = bt_instance.run(**params)
-            result = stats['Equity Final [$]']
+            result = maximize(stats) if callable(maximize) else stats[maximize]
             if result > best_result:
                 best_result = result
                 best_params = params
@@ -75,66 +95,148 @@ def manual_optimization_windows(bt_instance, param_grid):
             for k, v in p.items(): setattr(self, k, v)
     return MockResult(best_params)
 
-def walk_forward_optimization(data, strategy_class, window_days=90, step_days=30):
+def walk_forward_optimization(data, strategy_class, window_days=90, step_days=30, scheme='rolling', **split_kwargs):
+    """
+    scheme: 'rolling' / 'anchored' (okna window_days/step_days) lub 'cpcv'
+    (split_kwargs: n_groups, n_test_groups, purge_days, embargo_days).
+    """
     start_date = data.index[0]
     end_date = data.index[-1]
-    current_date = start_date
     results_log = []
+    oos_trades_log = []  # Transakcje każdego bloku testowego (równolegle do results_log)
+
+    # 1. Definicja Okien - raz, na offsetach dni (okna bez danych odpadają przed wycinaniem)
+    day_index = DayIndex(data.index)
+    if scheme != 'cpcv':
+        split_kwargs = dict(train_days=window_days, test_days=step_days, **split_kwargs)
+    splits = make_splits(scheme, day_index, min_train_rows=500, min_test_rows=50, **split_kwargs)
+    # CPCV: każdy dzień jest testowany w kilku podziałach - bloki składamy w rozłączne ścieżki
+    paths = cpcv_paths(splits)
     
     print(f"\n--- ROZPOCZYNAM WALK-FORWARD ANALYSIS ---")
     print(f"Zakres: {start_date} -> {end_date}")
+    print(f"Schemat: {scheme} | Okien: {len(splits)}")
+
+    # DEFINICJA SIATKI PARAMETRÓW
+    # Możesz tu dać więcej parametrów dla Linuxa, bo jest szybszy!
+    param_grid = {
+        'rsi_delta_ltf': range(4, 15, 2),
+        'rsi_delta_htf': range(10, 20, 5),
+        'risk_reward': [2.0, 2.5, 3.0],
+        'atr_multiplier': [1.0, 1.5, 2.5],
+        'di_stdev_len': [21],
+        'di_level_long': [50],
+    }
+
+    objective = make_mc_equity_score(cash=KAPITAL_POCZATKOWY) if MC_OBJECTIVE else 'Equity Final [$]'
+
+    # Zadania dla innych procesów opisujemy nazwami ('modul:atrybut'), nie obiektami
+    task_spec = {
+        'maximize': 'robustness:mc_equity_score' if MC_OBJECTIVE else objective,
+        'strategy': f"{strategy_class.__module__}:{strategy_class.__name__}",
+        'bt_kwargs': {'cash': KAPITAL_POCZATKOWY, 'commission': PROWIZJA, 'margin': 0.01},
+    }
+
+    # Checkpointy: klucz okna = ustawienia + treść danych train/test, gotowe okna pomijamy
+    checkpoint, window_keys, finished = None, [None] * len(splits), [None] * len(splits)
+    if CHECKPOINT_DIR:
+        checkpoint = WFOCheckpoint(CHECKPOINT_DIR, dict(
+            task_spec, scheme=scheme, split_kwargs=split_kwargs,
+            param_grid={k: list(v) for k, v in param_grid.items()},
+            intrabar=has_intrabar(data),
+        ))
+        for i, split in enumerate(splits):
+            labels = [[day_index.label(d0), day_index.label(d1)] for d0, d1 in split.train + split.test]
+            window_keys[i] = checkpoint.window_key(day_index.take(data, split.train),
+                                                   [day_index.take(data, [t]) for t in split.test], labels)
+            finished[i] = checkpoint.load(window_keys[i])
+        print(f"💾 Checkpointy: {CHECKPOINT_DIR} | Gotowych okien: {sum(r is not None for r in finished)}/{len(splits)}")
+
+    # Tryb rozproszony: wszystkie okna od razu do kolejki, workery liczą równolegle
+    jobs = None
+    pool = None
+    if QUEUE_DIR:
+        queue = DirQueue(QUEUE_DIR)
+        fingerprint = queue.publish_dataset(data)
+        jobs = [submit_grid(queue, fingerprint, param_grid, window=day_index.row_ranges(split.train),
+                            intrabar=has_intrabar(data), daily=True, **task_spec)
+                if record is None else None
+                for split, record in zip(splits, finished)]
+        print(f"📮 Kolejka: {QUEUE_DIR} | Zadań: {sum(len(j['tasks']) for j in jobs if j)}")
+    elif IS_WINDOWS and POOL_WORKERS:
+        # Dane publikowane raz - procesy dostają tylko uchwyt do wspólnej pamięci
+        pool = SharedGridPool(data, workers=POOL_WORKERS)
+        print(f"🧵 Pula: {pool.workers} procesów na wspólnej pamięci")
     
-    iteration = 0
-    while current_date + pd.Timedelta(days=window_days + step_days) < end_date:
-        iteration += 1
-        
-        # 1. Definicja Okien
-        train_start = current_date
-        train_end = current_date + pd.Timedelta(days=window_days)
-        test_start = train_end
-        test_end = test_start + pd.Timedelta(days=step_days)
-        
-        train_data = data.loc[train_start:train_end]
-        test_data = data.loc[test_start:test_end]
-        
-        if len(train_data) < 500 or len(test_data) < 50:
-            current_date += pd.Timedelta(days=step_days)
+    for iteration, split in enumerate(splits, 1):
+        train_start = day_index.label(split.train[0][0])
+        train_end = day_index.label(split.train[-1][1])
+
+        record = finished[iteration - 1]
+        if record is not None:
+            # Okno policzone wcześniej - wyniki z checkpointu
+            for block, entry in enumerate(record['out_of_sample']):
+                row = {k: v for k, v in entry.items() if k != 'stats'}
+                row['Period Start'] = pd.Timestamp(row['Period Start']).date()
+                row['Period End'] = pd.Timestamp(row['Period End']).date()
+                if split.groups is not None:
+                    row['Group'], row['Path'] = split.groups[block], paths[iteration - 1][block]
+                results_log.append(row)
+            try:
+                oos_trades_log.extend(checkpoint.load_trades(window_keys[iteration - 1]))
+            except FileNotFoundError:
+                oos_trades_log.extend([None] * len(record['out_of_sample']))
+            print(f"⏭️  [Iteracja {iteration}] {train_start}->{train_end} | z checkpointu")
             continue
 
-        print(f"🚀 [Iteracja {iteration}] {train_start.date()}->{train_end.date()} | ", end="")
+        # CPCV: train to sklejone, nieciągłe bloki dni - jeden Backtest widzi skok ceny na styku.
+        # Wskaźniki są liczone wcześniej na pełnych danych, a close_all (22:30) zamyka pozycje
+        # przed końcem dnia, więc transakcje nie przechodzą przez styk (o ile dzień ma świece po 22:30);
+        # zniekształcone są tylko metryki czasu / drawdown in-sample.
+        train_data = day_index.take(data, split.train)
+        print(f"🚀 [Iteracja {iteration}] {train_start}->{train_end} | ", end="")
+        started = time.perf_counter()
 
         # 2. OPTYMALIZACJA (In-Sample) - Zależna od systemu
         bt_train = Backtest(train_data, strategy_class, cash=KAPITAL_POCZATKOWY, commission=PROWIZJA, margin=0.01)
-        
-        # DEFINICJA SIATKI PARAMETRÓW
-        # Możesz tu dać więcej parametrów dla Linuxa, bo jest szybszy!
-        param_grid = {
-            'rsi_delta_ltf': range(4, 15, 2),
-            'rsi_delta_htf': range(10, 20, 5),
-            'risk_reward': [2.0, 2.5, 3.0],
-            'atr_multiplier': [1.0, 1.5, 2.5],
-            'di_stdev_len': [21],
-            'di_level_long': [50],
-        }
+
+        # Kostka dzienna siatki in-sample (ścieżki kolejki i puli) - do checkpointu okna
+        day_cube = None
 
         try:
-            if IS_WINDOWS:
+            if jobs is not None:
+                # Ścieżka rozproszona (kolejka + workery) - wynik jak w pętli jednowęzłowej
+                job = jobs[iteration - 1]
+                results = collect(queue, job)
+                best_params_obj = SimpleNamespace(**best_params(job, results))
+                day_cube = DayCube.from_results(job, results, cash=KAPITAL_POCZATKOWY)
+                print("DistOpti OK | ", end="")
+            elif pool is not None:
+                # Ścieżka Windows wielordzeniowa (spawn + wspólna pamięć) - wynik jak w pętli ręcznej
+                job, results = pool.run(param_grid, window=day_index.row_ranges(split.train), daily=True, **task_spec)
+                best_params_obj = SimpleNamespace(**best_params(job, results))
+                day_cube = DayCube.from_results(job, results, cash=KAPITAL_POCZATKOWY)
+                print("PoolOpti OK | ", end="")
+            elif IS_WINDOWS:
                 # Ścieżka dla Windows (Safe Mode)
-                best_params_obj = manual_optimization_windows(bt_train, param_grid)
+                best_params_obj = manual_optimization_windows(bt_train, param_grid, maximize=objective)
                 print("WinOpti OK | ", end="")
             else:
                 # Ścieżka dla Linux (Turbo Mode - Multicore)
-                stats_train = bt_train.optimize(
+                stats_train, heatmap = bt_train.optimize(
                     **param_grid,
                     maximize='Equity Final [$]',
-                    verbose=False
+                    return_heatmap=True
                 )
+                if MC_OBJECTIVE:
+                    # Wyniki z procesów nie mają listy transakcji - przeliczamy top-K
+                    stats_train, _ = rerank_top(bt_train, heatmap, objective)
                 best_params_obj = stats_train._strategy
                 print("LinuxOpti OK | ", end="")
 
+            optimize_time = time.perf_counter() - started
+
             # 3. TEST (Out-of-Sample)
-            bt_test = Backtest(test_data, strategy_class, cash=KAPITAL_POCZATKOWY, commission=PROWIZJA, margin=0.01)
-            
             # Wyciągamy parametry niezależnie od metody optymalizacji
             run_params = {
                 'rsi_delta_ltf': best_params_obj.rsi_delta_ltf,
@@ -146,18 +248,45 @@ def walk_forward_optimization(data, strategy_class, window_days=90, step_days=30
                 'di_level_short': best_params_obj.di_level_long
             }
             
-            stats_test = bt_test.run(**run_params)
-            net_profit = stats_test['Equity Final [$]'] - KAPITAL_POCZATKOWY
-            
-            results_log.append({
-                'Period Start': test_start.date(),
-                'Period End': test_end.date(),
-                'Net Profit': net_profit,
-                'Trades': stats_test['# Trades'],
-                'Params': f"RSI:{run_params['rsi_delta_ltf']} RR:{run_params['risk_reward']}"
-            })
-            
-            print(f"✅ ZYSK: {net_profit:8.2f}$")
+            out_of_sample, oos_trades = [], []
+
+            # CPCV może mieć kilka bloków testowych (po jednym na grupę) - każdy osobno
+            for block, (test_start, test_end) in enumerate(split.test):
+                test_data = day_index.take(data, [(test_start, test_end)])
+                bt_test = Backtest(test_data, strategy_class, cash=KAPITAL_POCZATKOWY, commission=PROWIZJA, margin=0.01)
+
+                stats_test = bt_test.run(**run_params)
+                net_profit = stats_test['Equity Final [$]'] - KAPITAL_POCZATKOWY
+                
+                results_log.append({
+                    'Period Start': day_index.label(test_start),
+                    'Period End': day_index.label(test_end),
+                    'Net Profit': net_profit,
+                    'Trades': stats_test['# Trades'],
+                    'Params': f"RSI:{run_params['rsi_delta_ltf']} RR:{run_params['risk_reward']}"
+                })
+                if split.groups is not None:
+                    results_log[-1]['Group'] = split.groups[block]
+                    results_log[-1]['Path'] = paths[iteration - 1][block]
+                out_of_sample.append(dict(stats_dict(results_log[-1]), stats=stats_dict(stats_test)))
+                oos_trades.append(stats_test['_trades'])
+                oos_trades_log.append(stats_test['_trades'])
+                
+                print(f"✅ ZYSK: {net_profit:8.2f}$")
+
+            # 4. ZAPIS OKNA (parametry, IS/OOS, transakcje, czasy)
+            if checkpoint is not None:
+                test_time = time.perf_counter() - started - optimize_time
+                stats_is = bt_train.run(**run_params)
+                checkpoint.save(window_keys[iteration - 1], {
+                    'iteration': iteration,
+                    'train': [[day_index.label(d0), day_index.label(d1)] for d0, d1 in split.train],
+                    'test': [[day_index.label(d0), day_index.label(d1)] for d0, d1 in split.test],
+                    'params': stats_dict(run_params),
+                    'in_sample': stats_dict(stats_is),
+                    'out_of_sample': out_of_sample,
+                    'timing': {'optimize_s': optimize_time, 'test_s': test_time},
+                }, trades=oos_trades, cube=day_cube)
             
         except Exception as e:
             print(f"\n❌ BŁĄD: {e}")
@@ -166,21 +295,57 @@ def walk_forward_optimization(data, strategy_class, window_days=90, step_days=30
                 import traceback
                 traceback.print_exc()
 
-        current_date += pd.Timedelta(days=step_days)
+    if pool is not None:
+        pool.close()
 
-    # 4. Podsumowanie
+    # 5. Podsumowanie
     print("\n" + "="*50)
     if not results_log:
         print("⚠️ Brak wyników.")
         return
 
     df_res = pd.DataFrame(results_log)
-    total = df_res['Net Profit'].sum()
-    print(f"SUMA ZYSKÓW WFA: {total:.2f} $")
-    print(f"Średnia na miesiąc: {df_res['Net Profit'].mean():.2f} $")
+    if checkpoint is not None:
+        df_res.to_csv(os.path.join(CHECKPOINT_DIR, "wfo_summary.csv"), index=False)
+    if 'Path' in df_res:
+        # Bloki CPCV nakładają się (dzień testowany w C(N-1, k-1) podziałach) - suma po wszystkich
+        # blokach liczyłaby każdy dzień wielokrotnie. Sumujemy per ścieżka (każda grupa dokładnie raz).
+        n_groups = len({g for split in splits for g in split.groups})
+        per_path = df_res.groupby('Path').agg(profit=('Net Profit', 'sum'), trades=('Trades', 'sum'),
+                                              groups=('Group', 'nunique'))
+        complete = per_path[per_path['groups'] == n_groups]
+        print(f"ŚCIEŻKI CPCV: {len(per_path)} (pełnych: {len(complete)}, grup na ścieżkę: {n_groups})")
+        if not complete.empty:
+            print(f"Zysk na ścieżkę (pełne): średnio {complete['profit'].mean():.2f} $ | "
+                  f"min {complete['profit'].min():.2f} $ | max {complete['profit'].max():.2f} $")
+        print(per_path.round(2).to_string())
+        print(f"Średnia na blok testowy (grupę): {df_res['Net Profit'].mean():.2f} $")
+    else:
+        total = df_res['Net Profit'].sum()
+        print(f"SUMA ZYSKÓW WFA: {total:.2f} $")
+        print(f"Średnia na miesiąc: {df_res['Net Profit'].mean():.2f} $")
     print("-" * 50)
     print(df_res)
 
+    # Koszty co-jeśli: przeliczenie transakcji OOS (z checkpointów i bieżącego przebiegu), bez ponownych testów
+    try:
+        known = [i for i, trades in enumerate(oos_trades_log) if trades is not None]
+        scenarios = cost_scenarios(COST_COMMISSIONS, COST_SPREADS, COST_SLIPPAGES)
+        repriced = reprice({i: oos_trades_log[i] for i in known}, scenarios, cash=KAPITAL_POCZATKOWY)
+        table = repriced.reset_index().join(df_res.drop(columns=['Trades']), on='run')
+        cost_cols = list(scenarios.columns)
+        print(f"\nKOSZTY CO-JEŚLI (transakcje OOS, bloków: {len(known)}/{len(df_res)}):")
+        if 'Path' in df_res:
+            # Jak wyżej: zysk per ścieżka CPCV (pełne ścieżki), nie suma nakładających się bloków
+            full = table[table['Path'].isin(complete.index)]
+            per_path = full.groupby(cost_cols + ['Path'])['net_profit'].sum()
+            print(per_path.groupby(cost_cols).agg(['mean', 'min', 'max']).round(2).to_string())
+        else:
+            print(table.groupby(cost_cols).agg(net_profit=('net_profit', 'sum'), trades=('trades', 'sum'),
+                                           flagged=('flagged', 'sum')).round(2).to_string())
+    except Exception as e:
+        print(f"Błąd przeliczenia kosztów: {e}")
+
 if __name__ == '__main__':
     # Fix dla multiprocessing na Linux (czasem wymagany)
     if not IS_WINDOWS:
@@ -192,12 +357,15 @@ if __name__ == '__main__':
         print(f"❌ Nie znaleziono pliku: {NAZWA_PLIKU}")
         exit()
         
+    if QUEUE_DIR and LOCAL_WORKERS:
+        start_local_workers(QUEUE_DIR, LOCAL_WORKERS)
+
     print(f"📂 Wczytywanie: {found_path}")
-    data = prepare_data_with_indicators(found_path, ltf_res=LTF, htf_res=HTF_RES)
+    data = prepare_data_with_indicators(found_path, ltf_res=LTF, htf_res=HTF_RES, intrabar=INTRABAR)
     
     # Fix Timezone
     if data is not None and data.index.tz is not None:
         data.index = data.index.tz_localize(None)
 
     if data is not None and not data.empty:
-        walk_forward_optimization(data, Strategy2xRSI_Dorsey, window_days=90, step_days=30)
+        walk_forward_optimization(data, Strategy2xRSI_Dorsey, window_days=90, step_days=30, scheme=WFO_SCHEME)
@@ -1,7 +1,6 @@
 import warnings
 warnings.filterwarnings("ignore")
 import platform
-import os
 
 # --- 1. AUTOMATYCZNA KONFIGURACJA SYSTEMU ---
 SYSTEM_OS = platform.system()
@@ -17,30 +16,71 @@ else:
 
 from backtesting import Backtest
 from strategies import Strategy2xRSI_Dorsey
-from data_loader import prepare_data_with_indicators
+from data_loader import PrepPipeline
+from robustness import make_mc_score, rerank_top, robustness_report
+from results_cube import ResultCube, TopK
+from costs import cost_scenarios, reprice, grid_cost_summary
+from shared_data import SharedGridPool
+from distributed import best_params
+from day_cube import DayCube
+from scoring import optim_score, MIN_TRADES
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
-import numpy as np
 from tqdm import tqdm
 import config
 
 # --- 2. FUNKCJA OCENY (SCORE) ---
-def optim_score(stats):
+# optim_score (Win Rate > 50% poparty liczbą transakcji) - scoring.py
+
+# Opcjonalnie: ta sama ocena, ale jako dolny kwantyl po bootstrapie transakcji
+mc_optim_score = make_mc_score(n_paths=config.MC_PATHS, quantile=config.MC_QUANTILE)
+
+def step_summary(score, stats, rsi_len):
+    """Parametry i wynik jednej kombinacji (format lidera i rankingu TOP-K)."""
+    return {
+        'score': score,
+        'wr': stats['Win Rate [%]'],
+        'trades': stats['# Trades'],
+        'rsi_len': rsi_len,
+        'delta_htf': stats._strategy.rsi_delta_htf,
+        'delta_ltf': stats._strategy.rsi_delta_ltf,
+        'atr': stats._strategy.atr_multiplier,
+        'rr': stats._strategy.risk_reward
+    }
+
+def push_top_k(leaders, heatmap, bt, rsi_len, known_stats=None):
     """
-    Ocenia jakość strategii.
-    Cel: Wysoki Win Rate (>50%) poparty dużą liczbą transakcji.
+    Ranking TOP-K po kombinacjach całej siatki (wszystkie RSI Len), wg optim_score z heatmapy.
+    Z kroku tylko K najlepszych może wejść do rankingu; pełne statystyki (bt.run)
+    liczymy wyłącznie dla kombinacji, które do niego wchodzą.
     """
-    win_rate = stats['Win Rate [%]']
-    trades = stats['# Trades']
-    
-    # FILTR: Odrzucamy strategie z małą liczbą transakcji (szum statystyczny)
-    if trades < 30:
-        return -1.0
+    for combo, score in heatmap.dropna().nlargest(leaders.k).items():
+        if not leaders.accepts(score):
+            break
+        params = dict(zip(heatmap.index.names, combo if isinstance(combo, tuple) else (combo,)))
+        stats = known_stats
+        if stats is None or any(getattr(stats._strategy, k) != v for k, v in params.items()):
+            stats = bt.run(**params)
+        leaders.push(score, step_summary(score, stats, rsi_len), stats)
 
-    # Wzór: Nadwyżka WinRate nad 50% * Pierwiastek z liczby transakcji
-    # (Używamy pierwiastka, aby 1000 transakcji nie dominowało wyniku nad jakością sygnału)
-    return (win_rate - 50) * np.sqrt(trades)
+def pool_optimize(bt, data, param_grid, workers):
+    """
+    bt.optimize(maximize=optim_score, return_heatmap=True) policzone w SharedGridPool:
+    ta sama heatmapa i zwycięzca (pierwsze maksimum w kolejności siatki), a do tego
+    lista transakcji i agregaty dzienne każdej kombinacji (kolumny 'trade_list', 'daily').
+    Zwraca (stats, heatmap, job, results).
+    """
+    strategy = f"{Strategy2xRSI_Dorsey.__module__}:{Strategy2xRSI_Dorsey.__name__}"
+    bt_kwargs = {'cash': config.CASH, 'commission': config.PROWIZJA, 'margin': 0.01}
+    with SharedGridPool(data, workers=workers) as pool:
+        job, results = pool.run(param_grid, strategy, maximize='scoring:optim_score',
+                                bt_kwargs=bt_kwargs, trades=True, daily=True)
+    # bt.optimize pomija przebiegi bez transakcji (NaN w heatmapie) - evaluate_chunk je ocenia
+    results['value'] = results['value'].where(results['trades'] > 0)
+    heatmap = pd.Series(results['value'].to_numpy(dtype=float),
+                        index=pd.MultiIndex.from_frame(results[list(param_grid)]))
+    return bt.run(**best_params(job, results)), heatmap, job, results
 
 # -----------------------------------------------------------------------
 
@@ -59,11 +99,22 @@ def run_strategy_backtest():
     r_delta_htf = range(26, 34,1)
     r_atr = [2.0, 3.0]
     r_rr = [1.0, 1.5] # Sztywne RR=1 dla testu "Edge"
+    param_grid = dict(rsi_delta_ltf=r_delta_ltf, rsi_delta_htf=r_delta_htf, atr_multiplier=r_atr, risk_reward=r_rr)
 
     # Zmienne do śledzenia rekordu
     global_best_score = -9999.0
     global_best_params = {}
-    global_best_heatmap = None # Przechowamy heatmapę zwycięzcy
+    # Wyniki CAŁEJ siatki (wszystkie RSI Len) w kostce N-D + K najlepszych pełnych statystyk
+    cube = ResultCube.from_grid(
+        rsi_len=RSI_LENGTHS_TO_TEST,
+        rsi_delta_ltf=r_delta_ltf,
+        rsi_delta_htf=r_delta_htf,
+        atr_multiplier=r_atr,
+        risk_reward=r_rr
+    )
+    leaders = TopK(config.TOP_K)
+    # Listy transakcji i kostki dzienne całej siatki (tylko ścieżka puli, GRID_WORKERS > 0)
+    grid_params, grid_trades, day_cubes = [], [], {}
 
     # Informacyjnie
     combos_per_step = len(r_delta_ltf) * len(r_delta_htf) * len(r_atr) * len(r_rr)
@@ -74,92 +125,134 @@ def run_strategy_backtest():
     # 4. PROCES OPTYMALIZACJI
     # ==========================================
     
-    # Pętla po długościach RSI z paskiem postępu
-    for current_rsi_len in tqdm(RSI_LENGTHS_TO_TEST, desc="Postęp Główny"):
-        
-        # a) Wczytanie danych
-        data = prepare_data_with_indicators(config.CSV_PATH, rsi_len=current_rsi_len)
-        if data is None: continue
-
-        # b) Init Backtestu
-        bt = Backtest(
-            data,
-            Strategy2xRSI_Dorsey,
-            cash=config.CASH,
-            commission=config.PROWIZJA,
-            margin=0.01 
-        )
+    # Dane dla kolejnego RSI Len przygotowywane w tle, gdy bieżąca siatka się liczy
+    with PrepPipeline(config.CSV_PATH, RSI_LENGTHS_TO_TEST, prefetch=config.PREP_PREFETCH,
+                      cache_size=config.PREP_CACHE_SIZE, intrabar=config.INTRABAR_RESOLUTION,
+                      ltf_res=config.LTF, htf_res=config.HTF) as pipeline:
+
+        # Pętla po długościach RSI z paskiem postępu
+        for current_rsi_len, data in tqdm(pipeline, total=len(RSI_LENGTHS_TO_TEST), desc="Postęp Główny"):
         
-        try:
-            # c) Optymalizacja wielowątkowa
-            stats, heatmap = bt.optimize(
-                rsi_delta_ltf=r_delta_ltf,
-                rsi_delta_htf=r_delta_htf,
-                atr_multiplier=r_atr,
-                risk_reward=r_rr,
-                maximize=optim_score,   # <--- Używamy własnej funkcji oceny
-                return_heatmap=True     # Pobieramy heatmapę, żeby zapisać ją jeśli wygramy
+            # a) Dane (gotowe z potoku)
+            if data is None: continue
+
+            # b) Init Backtestu
+            bt = Backtest(
+                data,
+                Strategy2xRSI_Dorsey,
+                cash=config.CASH,
+                commission=config.PROWIZJA,
+                margin=0.01 
             )
+        
+            try:
+                # c) Optymalizacja wielowątkowa
+                if config.GRID_WORKERS:
+                    # Pula na wspólnej pamięci - heatmapa jak z bt.optimize + listy transakcji
+                    stats, heatmap, job, results = pool_optimize(bt, data, param_grid, config.GRID_WORKERS)
+                    done = results['trade_list'].notna()
+                    grid_params.append(results.loc[done, list(param_grid)].assign(rsi_len=current_rsi_len))
+                    grid_trades.extend(results.loc[done, 'trade_list'])
+                    day_cubes[current_rsi_len] = DayCube.from_results(job, results, cash=config.CASH)
+                else:
+                    stats, heatmap = bt.optimize(
+                        **param_grid,
+                        maximize=optim_score,   # <--- Używamy własnej funkcji oceny
+                        return_heatmap=True     # Heatmapa trafia do kostki wyników
+                    )
+                cube.fill_from_heatmap(heatmap, rsi_len=current_rsi_len)
             
-            # d) Ocena wyniku
-            current_score = optim_score(stats)
+                # d) Ocena wyniku
+                if config.MC_OBJECTIVE:
+                    # bt.optimize() nie oddaje listy transakcji - przeliczamy top-K z heatmapy
+                    stats, current_score = rerank_top(bt, heatmap, mc_optim_score, top_k=config.MC_TOP_K)
+                    if stats is None: continue
+                else:
+                    current_score = optim_score(stats)
+
+                step_params = step_summary(current_score, stats, current_rsi_len)
+                push_top_k(leaders, heatmap, bt, current_rsi_len, known_stats=stats)
             
-            if current_score > global_best_score:
-                global_best_score = current_score
-                global_best_heatmap = heatmap # Zapisujemy mapę ciepła obecnego lidera
-                
-                # Zapisujemy parametry mistrza
-                global_best_params = {
-                    'score': current_score,
-                    'wr': stats['Win Rate [%]'],
-                    'trades': stats['# Trades'],
-                    'rsi_len': current_rsi_len,
-                    'delta_htf': stats._strategy.rsi_delta_htf,
-                    'delta_ltf': stats._strategy.rsi_delta_ltf,
-                    'atr': stats._strategy.atr_multiplier,
-                    'rr': stats._strategy.risk_reward
-                }
+                if current_score > global_best_score:
+                    global_best_score = current_score
+                    # Zapisujemy parametry mistrza
+                    global_best_params = step_params
+                    pipeline.pin(current_rsi_len)  # Dane lidera zostają w cache do raportu końcowego
                 
-                tqdm.write(f"--> NOWY LIDER! RSI({current_rsi_len}) | Score: {current_score:.2f} | WR: {stats['Win Rate [%]']:.2f}% | Trades: {stats['# Trades']}")
+                    tqdm.write(f"--> NOWY LIDER! RSI({current_rsi_len}) | Score: {current_score:.2f} | WR: {stats['Win Rate [%]']:.2f}% | Trades: {stats['# Trades']}")
 
-        except Exception as e:
-            # Ignorujemy błędy braku transakcji w optimize
-            pass
+            except Exception as e:
+                # Ignorujemy błędy braku transakcji w optimize
+                pass
 
-    # ==========================================
-    # 5. PODSUMOWANIE I RAPORT
-    # ==========================================
-    print("\n" + "="*50)
-    print("       MISTRZ ŚWIATA (GLOBAL BEST)       ")
-    print("="*50)
+        # ==========================================
+        # 5. PODSUMOWANIE I RAPORT
+        # ==========================================
+        print("\n" + "="*50)
+        print("       MISTRZ ŚWIATA (GLOBAL BEST)       ")
+        print("="*50)
     
-    if not global_best_params:
-        print("Nie znaleziono strategii spełniającej kryteria (min. 30 transakcji).")
-        return
-
-    print(f"💎 Wynik Score:      {global_best_params['score']:.4f}")
-    print(f"💰 Win Rate:         {global_best_params['wr']:.2f}%")
-    print(f"📊 Liczba transakcji:{global_best_params['trades']}")
-    print("-" * 30)
-    print(f"🏆 RSI Len:      {global_best_params['rsi_len']}")
-    print(f"   Delta HTF:    {global_best_params['delta_htf']}")
-    print(f"   Delta LTF:    {global_best_params['delta_ltf']}")
-    print(f"   ATR Mult:     {global_best_params['atr']}")
-    print(f"   Risk/Reward:  {global_best_params['rr']}")
-    print("="*50)
-
-    # --- A. GENROWANIE MAPY CIEPŁA DLA ZWYCIĘZCY ---
-    if global_best_heatmap is not None:
+        if not global_best_params:
+            print(f"Nie znaleziono strategii spełniającej kryteria (min. {MIN_TRADES} transakcji).")
+            return
+
+        print(f"💎 Wynik Score:      {global_best_params['score']:.4f}")
+        print(f"💰 Win Rate:         {global_best_params['wr']:.2f}%")
+        print(f"📊 Liczba transakcji:{global_best_params['trades']}")
+        print("-" * 30)
+        print(f"🏆 RSI Len:      {global_best_params['rsi_len']}")
+        print(f"   Delta HTF:    {global_best_params['delta_htf']}")
+        print(f"   Delta LTF:    {global_best_params['delta_ltf']}")
+        print(f"   ATR Mult:     {global_best_params['atr']}")
+        print(f"   Risk/Reward:  {global_best_params['rr']}")
+        print("="*50)
+
+        # Ranking K najlepszych kombinacji całej siatki (wg optim_score)
+        print(f"\nTOP {len(leaders)} kombinacji siatki:")
+        for score, p, _ in leaders.items():
+            print(f"   Score {score:8.2f} | RSI({p['rsi_len']}) HTF={p['delta_htf']} LTF={p['delta_ltf']} ATR={p['atr']} RR={p['rr']}")
+
+        # Wrażliwość TOP-K na koszty - przeliczenie zapisanych list transakcji (bez ponownych backtestów)
+        try:
+            scenarios = cost_scenarios(config.COST_COMMISSIONS, config.COST_SPREADS, config.COST_SLIPPAGES)
+            top_stats = {f"#{rank}": stats for rank, (_, _, stats) in enumerate(leaders.items(), 1)}
+            repriced = reprice(top_stats, scenarios, cash=config.CASH)
+            print("\nKoszty co-jeśli (optim_score / zysk netto):")
+            print(repriced.set_index(list(scenarios.columns), append=True)
+                          .droplevel('scenario')[['trades', 'win_rate', 'optim_score', 'net_profit', 'flagged']]
+                          .round(2).to_string())
+
+            # Cała siatka (ścieżka puli): czy zwycięzca i liczba dobrych kombinacji przetrwają wyższe koszty
+            if grid_trades:
+                grid_repriced = reprice(grid_trades, scenarios, cash=config.CASH)
+                print(f"\nKoszty co-jeśli - cała siatka ({len(grid_trades)} kombinacji), najlepsza per scenariusz:")
+                print(grid_cost_summary(grid_repriced, pd.concat(grid_params, ignore_index=True)).round(2).to_string())
+            else:
+                print("(Koszty co-jeśli dla całej siatki: GRID_WORKERS > 0 w config.py)")
+        except Exception as e:
+            print(f"Błąd przeliczenia kosztów: {e}")
+
+        # Kostka wyników (cała siatka) + najstabilniejszy "płaskowyż"
+        cube.save(config.RESULTS_CUBE_PATH)
+        plateau_params, plateau_score = cube.plateau(radius=1).best()
+        print(f"\nZapisano kostkę wyników: {config.RESULTS_CUBE_PATH}.npy/.json {cube}")
+        print(f"Najlepszy płaskowyż (średnia sąsiedztwa +-1): {plateau_score:.2f} @ {plateau_params}")
+
+        # Kostka dzienna całej siatki (wszystkie RSI Len) - zakresy dat / reżimy bez backtestów (debug_report.py, MODE='cube')
+        if day_cubes:
+            day_cube = DayCube.concat(day_cubes, name='rsi_len')
+            day_cube.save(config.DAY_CUBE_PATH)
+            print(f"Zapisano kostkę dzienną: {config.DAY_CUBE_PATH}.npz/.json {day_cube}")
+
+        # --- A. GENROWANIE MAPY CIEPŁA DLA ZWYCIĘZCY ---
         try:
             print("\nGeneruję mapę ciepła dla zwycięskiej konfiguracji...")
-            # Grupowanie wg delty HTF i LTF, biorąc MAX Score (lub max WR, zależnie co heatmapa trzyma)
-            # Domyślnie heatmapa trzyma wartość z maximize (czyli Score)
-            heatmap_grouped = global_best_heatmap.groupby(['rsi_delta_htf', 'rsi_delta_ltf']).max()
-            hm_matrix = heatmap_grouped.unstack()
-            
+            # Wycinek kostki dla RSI Len zwycięzcy, MAX Score po pozostałych osiach
+            hm_matrix = cube.sel(rsi_len=global_best_params['rsi_len']).to_frame('rsi_delta_htf', 'rsi_delta_ltf', how='max')
+        
             # Zapis do CSV
             hm_matrix.to_csv("best_heatmap_score.csv")
-            
+        
             # Wykres
             plt.figure(figsize=(10, 8))
             sns.heatmap(hm_matrix, annot=True, fmt='.1f', cmap='viridis', cbar_kws={'label': 'Optimization Score'})
@@ -167,51 +260,58 @@ def run_strategy_backtest():
             plt.xlabel('RSI Delta LTF')
             plt.ylabel('RSI Delta HTF')
             plt.gca().invert_yaxis()
-            
+        
             # Zapis pliku
             plt.savefig("best_heatmap.png")
             print("Zapisano: best_heatmap.png oraz best_heatmap_score.csv")
-            
+        
             # Wyświetlenie (tylko Windows)
             if not HEADLESS:
                 plt.show()
-                
+            
             plt.close()
         except Exception as e:
             print(f"Błąd rysowania mapy: {e}")
 
-    # --- B. SZCZEGÓŁOWY RAPORT I WYKRES EQUITY ---
-    print("\nUruchamiam szczegółowy test dla zwycięzcy...")
+        # --- B. SZCZEGÓŁOWY RAPORT I WYKRES EQUITY ---
+        print("\nUruchamiam szczegółowy test dla zwycięzcy...")
     
-    # 1. Ponowne wczytanie danych
-    final_data = prepare_data_with_indicators(config.CSV_PATH, rsi_len=global_best_params['rsi_len'])
+        # 1. Dane zwycięzcy z cache potoku (bez ponownego wczytywania)
+        final_data = pipeline.get(global_best_params['rsi_len'])
     
-    # 2. Uruchomienie testu
-    bt_final = Backtest(
-        final_data, 
-        Strategy2xRSI_Dorsey, 
-        cash=config.CASH, 
-        commission=config.PROWIZJA, 
-        margin=0.01
-    )
+        # 2. Uruchomienie testu
+        bt_final = Backtest(
+            final_data, 
+            Strategy2xRSI_Dorsey, 
+            cash=config.CASH, 
+            commission=config.PROWIZJA, 
+            margin=0.01
+        )
     
-    final_stats = bt_final.run(
-        rsi_delta_ltf=global_best_params['delta_ltf'],
-        rsi_delta_htf=global_best_params['delta_htf'],
-        atr_multiplier=global_best_params['atr'],
-        risk_reward=global_best_params['rr'] # float
-    )
+        final_stats = bt_final.run(
+            rsi_delta_ltf=global_best_params['delta_ltf'],
+            rsi_delta_htf=global_best_params['delta_htf'],
+            atr_multiplier=global_best_params['atr'],
+            risk_reward=global_best_params['rr'] # float
+        )
     
-    print(final_stats)
-
-    # 3. Zapis HTML
-    try:
-        filename = "Best_Strategy_Results.html"
-        # Otwórz przeglądarkę tylko jeśli NIE jesteśmy na Linuxie
-        bt_final.plot(filename=filename, open_browser=(not HEADLESS))
-        print(f"\nZapisano raport HTML do: {filename}")
-    except Exception as e:
-        print(f"\nBłąd generowania HTML: {e}")
+        print(final_stats)
+
+        # 3a. Odporność zwycięzcy (Monte Carlo na liście transakcji)
+        try:
+            print("\nMonte Carlo (przedziały ufności):")
+            print(robustness_report(final_stats, n_paths=config.MC_REPORT_PATHS, cash=config.CASH))
+        except Exception as e:
+            print(f"Błąd Monte Carlo: {e}")
+
+        # 4. Zapis HTML
+        try:
+            filename = "Best_Strategy_Results.html"
+            # Otwórz przeglądarkę tylko jeśli NIE jesteśmy na Linuxie
+            bt_final.plot(filename=filename, open_browser=(not HEADLESS))
+            print(f"\nZapisano raport HTML do: {filename}")
+        except Exception as e:
+            print(f"\nBłąd generowania HTML: {e}")
 
 if __name__ == '__main__':
     run_strategy_backtest()
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import pickle
+from datetime import datetime
+import pandas as pd
+from distributed import dataset_fingerprint
+from common import atomic_write, plain
+
+# ==========================================
+# CHECKPOINTY WALK-FORWARD (ARTEFAKTY OKIEN)
+# ==========================================
+# Każde okno WFO zapisujemy zaraz po policzeniu:
+#
+#   <root>/<klucz>/window.json   - parametry, statystyki IS/OOS, czasy (zapisywany na końcu = znacznik ukończenia)
+#   <root>/<klucz>/trades.pkl    - transakcje OOS (lista DataFrame, po jednym na blok testowy)
+#   <root>/<klucz>/day_cube.*    - kostka dzienna siatki in-sample (day_cube.DayCube; ścieżki puli / kolejki)
+#
+# Klucz okna = ustawienia przebiegu + odcisk treści danych train/test + daty.
+# Ponowne uruchomienie pomija gotowe okna; po dopisaniu nowych danych
+# wcześniejsze okna mają te same dane (wskaźniki są przyczynowe) -> liczą się tylko nowe.
+
+WINDOW_FILE = 'window.json'
+TRADES_FILE = 'trades.pkl'
+DAY_CUBE_FILE = 'day_cube'  # + .npz / .json
+
+def stats_dict(stats) -> dict:
+    """Statystyki bt.run() bez pól '_...' (strategia, equity, transakcje)."""
+    return {k: plain(v) for k, v in stats.items() if not k.startswith('_')}
+
+
+class WFOCheckpoint:
+    """Katalog z artefaktami okien jednego (lub wielu) przebiegów WFO."""
+
+    def __init__(self, root, settings: dict):
+        self.root = root
+        # Ustawienia wpływające na wynik okna (siatka, cel, strategia, koszty...)
+        self.settings = json.dumps(settings, sort_keys=True, default=str)
+        os.makedirs(root, exist_ok=True)
+
+    def window_key(self, train_data: pd.DataFrame, test_parts, labels) -> str:
+        h = hashlib.sha1(self.settings.encode())
+        h.update(json.dumps(labels, default=str).encode())
+        h.update(dataset_fingerprint(train_data).encode())
+        for part in test_parts:
+            h.update(dataset_fingerprint(part).encode())
+        return h.hexdigest()[:16]
+
+    def _dir(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        """Zapis okna albo None (brak / niedokończony)."""
+        try:
+            with open(os.path.join(self._dir(key), WINDOW_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load_trades(self, key):
+        with open(os.path.join(self._dir(key), TRADES_FILE), 'rb') as f:
+            return pickle.load(f)
+
+    def load_cube(self, key):
+        from day_cube import DayCube
+        return DayCube.load(os.path.join(self._dir(key), DAY_CUBE_FILE))
+
+    def save(self, key, record: dict, trades=None, cube=None):
+        os.makedirs(self._dir(key), exist_ok=True)
+        if trades is not None:
+            atomic_write(os.path.join(self._dir(key), TRADES_FILE),
+                          pickle.dumps(trades, protocol=pickle.HIGHEST_PROTOCOL))
+        if cube is not None:
+            cube.save(os.path.join(self._dir(key), DAY_CUBE_FILE))
+        # window.json na końcu - jego obecność oznacza ukończone okno
+        atomic_write(os.path.join(self._dir(key), WINDOW_FILE),
+                      json.dumps(dict(record, key=key, saved=datetime.now().isoformat()), default=str).encode())
+
+    def records(self) -> list:
+        """Wszystkie ukończone okna w katalogu (np. do analizy po fakcie)."""
+        out = []
+        for key in sorted(os.listdir(self.root)):
+            record = self.load(key) if os.path.isdir(self._dir(key)) else None
+            if record is not None:
+                out.append(record)
+        return out
@@ -0,0 +1,34 @@
+import itertools
+import os
+import uuid
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# WSPÓLNE NARZĘDZIA: SIATKA, JSON I ZAPIS ATOMOWY
+# ==========================================
+# Używane przez kolejkę (distributed), pulę (shared_data), lejek sygnałów
+# (signal_funnel), checkpointy WFO (checkpoints) i kostkę wyników (results_cube).
+
+def grid_combinations(param_grid: dict):
+    """Kombinacje w tej samej kolejności co manual_optimization_windows (itertools.product)."""
+    keys, values = zip(*param_grid.items())
+    return [dict(zip(keys, v)) for v in itertools.product(*values)]
+
+def plain(v):
+    """numpy / czas / inf i NaN -> typy JSON (także klucze słowników i osie kostek)."""
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, (pd.Timestamp, pd.Timedelta, datetime)):
+        return str(v)
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+def atomic_write(path, payload: bytes):
+    """Zapis przez plik tymczasowy + os.replace - czytelnik nigdy nie widzi połowy pliku."""
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
@@ -1,13 +1,14 @@
 # config.py
 
 # --- ŚCIEŻKI ---
-CSV_PATH = r"xauusd11M_dukas_ohlcv.csv"
+CSV_PATH = r"xauusd11M_dukas_ohlcv.csv"   # Plik, katalog shardów albo glob (np. r"dane/xauusd_*.csv")
 
 # --- BACKTEST ---
 LTF = '2min'
 HTF = '30min'
 PROWIZJA = 0.000008
 CASH = 100000
+INTRABAR_RESOLUTION = False  # True: SL/TP w jednej świecy rozstrzygane na danych 1-min (zmienia wyniki)
 
 # --- DORSEY INERTIA (Konstrukcyjne) ---
 DI_STDEV_LEN = 21
@@ -25,4 +26,26 @@ RSI_DELTA_HTF = 10
 
 # --- RYZYKO ---
 ATR_MULTIPLIER = 3.0
-RISK_REWARD = 1.0
\ No newline at end of file
+RISK_REWARD = 1.0
+
+# --- MONTE CARLO (ODPORNOŚĆ) ---
+MC_OBJECTIVE = False    # True: zwycięzca wg dolnego kwantyla optim_score po bootstrapie transakcji
+MC_PATHS = 2000         # Ścieżki na jedną ocenę w optymalizatorze
+MC_QUANTILE = 5         # Dolny kwantyl [%]
+MC_TOP_K = 20           # Ile najlepszych kombinacji z siatki przeliczamy ponownie
+MC_REPORT_PATHS = 20000 # Ścieżki w raporcie końcowym
+
+# --- WYNIKI OPTYMALIZACJI ---
+TOP_K = 5                           # Ile pełnych statystyk (najlepsze kombinacje całej siatki) trzymamy w pamięci
+RESULTS_CUBE_PATH = "results_cube"  # Kostka wyników: results_cube.npy + results_cube.json
+GRID_WORKERS = 0                    # >0: siatka każdego RSI Len w N procesach (SharedGridPool) zamiast bt.optimize;
+                                    #     daje listy transakcji całej siatki -> koszty co-jeśli dla wszystkich kombinacji
+DAY_CUBE_PATH = "day_cube"          # Kostka dzienna całej siatki (ścieżka puli): day_cube.npz + day_cube.json
+# --- PRZYGOTOWANIE DANYCH ---
+PREP_PREFETCH = 1       # Ile kolejnych wariantów (RSI Len) przygotowywać w tle podczas optymalizacji (0 = sekwencyjnie)
+PREP_CACHE_SIZE = 2     # Ile gotowych zbiorów trzymać w pamięci (+ zbiór bieżącego lidera)
+
+# --- KOSZTY: SCENARIUSZE CO-JEŚLI (costs.py) ---
+COST_COMMISSIONS = [PROWIZJA, 0.00002, 0.00005]  # Prowizja względna
+COST_SPREADS = [0.0, 0.00005]                    # Spread względny (na wejściu)
+COST_SLIPPAGES = [0.0, 0.00002]                  # Poślizg względny (rynkowe i stop)
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from scoring import MIN_TRADES, score_formula, trades_frame
+
+# ==========================================
+# CO-JEŚLI KOSZTY: PROWIZJA / SPREAD / POŚLIZG
+# ==========================================
+# Wejścia i wyjścia Strategy2xRSI_Dorsey zależą tylko od cen (SL/TP liczone
+# od Close świecy sygnału, nie od ceny wejścia), więc zmiana kosztów nie
+# zmienia listy transakcji - zmienia ich wycenę. Zamiast powtarzać
+# optymalizację dla każdej prowizji przeliczamy zapisane listy transakcji
+# (stats._trades) dla wektora scenariuszy kosztowych naraz: (listy x scenariusze).
+#
+# Model jak w brokerze backtesting.py 0.6:
+#  - spread tylko na wejściu (cena wejścia = fill * (1 +- spread)),
+#  - prowizja względna od wartości wejścia (z spreadem) i wyjścia,
+#  - wielkość pozycji size=0.1 z dostępnego depozytu (margin) - zależy od kapitału i kosztów.
+# Poślizg (slippage) - niekorzystne przesunięcie fill dla zleceń rynkowych i stop
+# (wejście, SL, zamknięcie dnia); TP to limit - bez poślizgu.
+
+COST_COLUMNS = ('commission', 'spread', 'slippage')
+
+def cost_scenarios(commission, spread=(0.0,), slippage=(0.0,)) -> pd.DataFrame:
+    """Siatka scenariuszy (iloczyn kartezjański) - jeden wiersz na scenariusz."""
+    index = pd.MultiIndex.from_product([commission, spread, slippage], names=COST_COLUMNS)
+    return index.to_frame(index=False).astype(float)
+
+def exit_kind(trades: pd.DataFrame) -> np.ndarray:
+    """
+    Rodzaj wyjścia po cenie: 'tp' (limit), 'sl' (stop) lub 'market' (zamknięcie dnia).
+    TP wypełnia się po TP lub lepiej, SL po SL lub gorzej (luka).
+    """
+    sign = np.sign(trades['Size'].to_numpy(dtype=float))
+    exit_price = trades['ExitPrice'].to_numpy(dtype=float)
+    sl = trades['SL'].to_numpy(dtype=float)
+    tp = trades['TP'].to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        is_tp = np.isfinite(tp) & (sign * (exit_price - tp) >= 0)
+        is_sl = np.isfinite(sl) & (sign * (exit_price - sl) <= 0)
+    return np.where(is_tp, 'tp', np.where(is_sl, 'sl', 'market'))
+
+def _stack(frames, base_spread):
+    """Listy transakcji -> tablice (listy, max_transakcji) dopełnione maską valid."""
+    n_max = max((len(t) for t in frames), default=0)
+    shape = (len(frames), n_max)
+    out = {k: np.zeros(shape) for k in ('sign', 'units', 'fill', 'exit', 'sl', 'tp')}
+    out['is_tp'] = np.zeros(shape, dtype=bool)
+    out['valid'] = np.zeros(shape, dtype=bool)
+    for i, t in enumerate(frames):
+        n = len(t)
+        if not n:
+            continue
+        size = t['Size'].to_numpy(dtype=float)
+        sign = np.sign(size)
+        out['sign'][i, :n] = sign
+        out['units'][i, :n] = np.abs(size)
+        # Cena wejścia w _trades zawiera spread - cofamy do ceny fill
+        out['fill'][i, :n] = t['EntryPrice'].to_numpy(dtype=float) / (1 + sign * base_spread)
+        out['exit'][i, :n] = t['ExitPrice'].to_numpy(dtype=float)
+        out['sl'][i, :n] = t['SL'].to_numpy(dtype=float)
+        out['tp'][i, :n] = t['TP'].to_numpy(dtype=float)
+        out['is_tp'][i, :n] = exit_kind(t) == 'tp'
+        out['valid'][i, :n] = True
+    return out
+
+def reprice(trade_lists, scenarios: pd.DataFrame, cash=100000, base_spread=0.0,
+            size=0.1, margin=0.01, resize=True, min_trades=MIN_TRADES) -> pd.DataFrame:
+    """
+    Przelicza listy transakcji dla wszystkich scenariuszy kosztów.
+
+    trade_lists: wynik bt.run() / DataFrame transakcji / kolumny z puli lub kolejki (trades=True),
+    lista albo dict nazwa -> wynik.
+    base_spread: spread, z którym listy powstały (do odtworzenia ceny fill; prowizja
+    nie wchodzi w ceny transakcji, więc bazowa nie jest potrzebna).
+    resize=True: wielkość pozycji liczona od nowa jak w brokerze (kapitał po kosztach
+    zmienia wielkość kolejnych pozycji); False: liczba jednostek jak w oryginale.
+
+    Zwraca DataFrame (lista, scenariusz) z: trades, net_profit, final_equity, win_rate,
+    optim_score, costs oraz flagged - transakcje, w których niekorzystne przesunięcie
+    wejścia dochodzi do poziomu SL/TP (w backteście zlecenie byłoby odrzucone albo
+    od razu zamknięte - wynik takiej transakcji z listy jest niewiarygodny).
+    """
+    if isinstance(trade_lists, dict):
+        names, items = list(trade_lists), list(trade_lists.values())
+    elif isinstance(trade_lists, (list, tuple)):
+        names, items = list(range(len(trade_lists))), list(trade_lists)
+    else:
+        names, items = [0], [trade_lists]
+    t = _stack([trades_frame(item) for item in items], base_spread)
+
+    # Scenariusze jako wiersz (1, S) - broadcast z listami (L, 1)
+    c = scenarios['commission'].to_numpy(dtype=float)[None, :]
+    sp = scenarios['spread'].to_numpy(dtype=float)[None, :]
+    slip = scenarios['slippage'].to_numpy(dtype=float)[None, :]
+    n_lists, n_scen = len(items), len(scenarios)
+
+    equity = np.full((n_lists, n_scen), float(cash))
+    costs = np.zeros((n_lists, n_scen))
+    taken = np.zeros((n_lists, n_scen))
+    wins = np.zeros((n_lists, n_scen))
+    flagged = np.zeros((n_lists, n_scen))
+
+    # Pętla tylko po numerze transakcji (kapitał jest sekwencyjny), reszta to tablice (L, S)
+    # errstate: pola dopełnienia (valid=False) dają dzielenie przez 0 - odrzuca je maska ok
+    for j in range(t['valid'].shape[1]):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sign = t['sign'][:, j:j + 1]
+            fill = t['fill'][:, j:j + 1] * (1 + sign * slip)
+            entry = fill * (1 + sign * sp)
+            exit_ = np.where(t['is_tp'][:, j:j + 1], t['exit'][:, j:j + 1],
+                             t['exit'][:, j:j + 1] * (1 - sign * slip))
+
+            if resize:
+                # Jak w Broker._process_orders: int(margin_available * leverage * size // (cena + prowizja/jedn.))
+                # (prowizja/jedn. w tej samej kolejności działań co broker - identyczne zaokrąglenia)
+                units = np.floor(equity * (1 / margin) * size // (entry + size * fill * c / size))
+            else:
+                units = np.broadcast_to(t['units'][:, j:j + 1], equity.shape)
+
+            fee = units * c * (entry + exit_)
+            pnl = sign * units * (exit_ - entry) - fee
+            ok = t['valid'][:, j:j + 1] & (units > 0)
+
+            equity += np.where(ok, pnl, 0.0)
+            costs += np.where(ok, fee, 0.0)
+            taken += ok
+            wins += ok & (pnl > 0)
+
+            # Wejście przesunięte za poziom SL/TP (poziomy stoją w miejscu, wejście nie)
+            past_sl = sign * (entry - t['sl'][:, j:j + 1]) <= 0
+            past_tp = sign * (t['tp'][:, j:j + 1] - entry) <= 0
+            flagged += ok & (past_sl | past_tp)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        win_rate = np.where(taken > 0, wins / taken * 100, np.nan)
+    score = score_formula(win_rate, taken, min_trades)
+
+    index = pd.MultiIndex.from_product([names, range(n_scen)], names=['run', 'scenario'])
+    result = pd.DataFrame({
+        'trades': taken.ravel().astype(int),
+        'net_profit': (equity - cash).ravel(),
+        'final_equity': equity.ravel(),
+        'win_rate': win_rate.ravel(),
+        'optim_score': score.ravel(),
+        'costs': costs.ravel(),
+        'flagged': flagged.ravel().astype(int),
+    }, index=index)
+    # Kolumny scenariusza obok wyników (czytelne tabele / pivot)
+    scen = scenarios.reset_index(drop=True).loc[index.get_level_values('scenario')].set_index(index)
+    return pd.concat([scen, result], axis=1)
+
+def grid_cost_summary(repriced: pd.DataFrame, params: pd.DataFrame) -> pd.DataFrame:
+    """
+    Przeliczenie całej siatki w skrócie - jeden wiersz na scenariusz (indeks = koszty): najlepsza kombinacja
+    wg optim_score (parametry, ocena, zysk) oraz ile kombinacji ma ocenę > 0 i zysk > 0.
+    params: parametry kombinacji, indeks = nazwy list z reprice() ('run').
+    """
+    rows = []
+    for _, group in repriced.groupby(level='scenario', sort=True):
+        runs = group.droplevel('scenario')
+        best = runs['optim_score'].idxmax()
+        row = runs.loc[best, list(COST_COLUMNS)].to_dict()
+        row.update({k: params.at[best, k] for k in params.columns})
+        row.update({
+            'optim_score': runs.loc[best, 'optim_score'],
+            'net_profit': runs.loc[best, 'net_profit'],
+            'score_gt_0': int((runs['optim_score'] > 0).sum()),
+            'profit_gt_0': int((runs['net_profit'] > 0).sum()),
+        })
+        rows.append(row)
+    return pd.DataFrame(rows).set_index(list(COST_COLUMNS))
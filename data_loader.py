@@ -1,86 +1,177 @@
+import glob
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
 import pandas as pd
 import numpy as np
-import pandas_ta as ta
+import indicators as ind
 
 # ==========================================
 # 1. INTELIGENTNA SEKCJA ŁADOWANIA DANYCH
 # ==========================================
 
+SHARD_PATTERN = '*.csv'          # Pliki brane z katalogu shardów
+SHARD_CACHE_DIR = '.shard_cache' # Cache sparsowanych shardów (obok plików CSV)
+RAW_PREFIX = {'High': 'Raw_High_', 'Low': 'Raw_Low_'}  # Kolumny danych 1-min w świecach (intrabar)
+
 def load_data_from_csv(filepath: str) -> pd.DataFrame:
     """
     Uniwersalny loader. Obsługuje:
     1. Pliki przetworzone/scalone (z nagłówkiem 'datetime', 'open'...)
     2. Surowe pliki Dukascopy (bez nagłówka, format GMT)
+    3. Katalog lub glob z shardami (np. eksporty roczne/miesięczne) -> load_shards()
     """
+    if is_sharded(filepath):
+        return load_shards(filepath)
+
     print(f"Wczytuję dane z {filepath}...")
     
     try:
-        # KROK 1: Szybki podgląd pliku, aby wykryć format
-        preview = pd.read_csv(filepath, nrows=1)
-        
-        # Sprawdzamy, czy plik ma nagłówek (czy kolumny nazywają się sensownie)
-        # Nasz scalacz tworzy kolumnę 'datetime'
-        is_processed = 'datetime' in preview.columns or 'date' in preview.columns or 'time' in preview.columns
-        
-        df = None
-        
-        if is_processed:
-            print("   -> Wykryto format: PRZETWORZONY (Standard CSV)")
-            df = pd.read_csv(filepath)
-            
-            # Znajdź kolumnę z datą
-            date_col = None
-            for col in ['datetime', 'date', 'Date_Time', 'time']:
-                if col in df.columns:
-                    date_col = col
-                    break
-            
-            if date_col:
-                # Parsujemy datę (Pandas sam zgadnie format ISO/Standard)
-                df['Date_Time'] = pd.to_datetime(df[date_col])
-                if date_col != 'Date_Time':
-                    df.drop(columns=[date_col], inplace=True)
-            else:
-                raise ValueError("Nie znaleziono kolumny z datą w pliku z nagłówkiem.")
-
-            # Standaryzacja nazw kolumn na Wielkie Litery (Open, High...)
-            # Ponieważ reszta kodu oczekuje Open/High/Low/Close/Volume
-            rename_map = {
-                'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume',
-                'Open': 'Open', 'High': 'High', 'Low': 'Low', 'Close': 'Close', 'Volume': 'Volume'
-            }
-            df.rename(columns=rename_map, inplace=True)
+        return _parse_csv(filepath)
 
-        else:
-            print("   -> Wykryto format: SUROWY (Dukascopy/MT5 bez nagłówka)")
-            # Stara logika dla surowych plików
-            column_names = ['Date_Time', 'Open', 'High', 'Low', 'Close', 'Volume']
-            df = pd.read_csv(filepath, header=None, names=column_names)
-            
-            # Specyficzne czyszczenie daty Dukascopy
-            # Format: 13.01.2025 00:00:00.000 GMT+0100
-            print("   -> Konwersja daty Dukascopy...")
-            df['Date_Time'] = df['Date_Time'].astype(str).str.replace(r' GMT[+-]\d{4}', '', regex=True)
-            df['Date_Time'] = pd.to_datetime(df['Date_Time'], format='%d.%m.%Y %H:%M:%S.%f')
-
-        # --- WSPÓLNA OBRÓBKA DANYCH ---
-        df.set_index('Date_Time', inplace=True)
+    except Exception as e:
+        print(f"❌ KRYTYCZNY BŁĄD w data_loader: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _parse_csv(filepath: str) -> pd.DataFrame:
+    """Parsowanie jednego pliku (wykrycie formatu + wspólna obróbka). Błędy lecą wyżej."""
+    # KROK 1: Szybki podgląd pliku, aby wykryć format
+    preview = pd.read_csv(filepath, nrows=1)
+    
+    # Sprawdzamy, czy plik ma nagłówek (czy kolumny nazywają się sensownie)
+    # Nasz scalacz tworzy kolumnę 'datetime'
+    is_processed = 'datetime' in preview.columns or 'date' in preview.columns or 'time' in preview.columns
+    
+    df = None
+    
+    if is_processed:
+        print("   -> Wykryto format: PRZETWORZONY (Standard CSV)")
+        df = pd.read_csv(filepath)
         
-        # Konwersja na liczby (dla pewności)
-        cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-        for col in cols:
+        # Znajdź kolumnę z datą
+        date_col = None
+        for col in ['datetime', 'date', 'Date_Time', 'time']:
             if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+                date_col = col
+                break
         
-        df.dropna(inplace=True)
-        
-        # Filtry jakościowe
-        initial_len = len(df)
-        df = df[df['Volume'] > 0]
-        df = df[df['High'] != df['Low']] # Usunięcie płaskich świec
+        if date_col:
+            # Parsujemy datę (Pandas sam zgadnie format ISO/Standard)
+            df['Date_Time'] = pd.to_datetime(df[date_col])
+            if date_col != 'Date_Time':
+                df.drop(columns=[date_col], inplace=True)
+        else:
+            raise ValueError("Nie znaleziono kolumny z datą w pliku z nagłówkiem.")
+
+        # Standaryzacja nazw kolumn na Wielkie Litery (Open, High...)
+        # Ponieważ reszta kodu oczekuje Open/High/Low/Close/Volume
+        rename_map = {
+            'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume',
+            'Open': 'Open', 'High': 'High', 'Low': 'Low', 'Close': 'Close', 'Volume': 'Volume'
+        }
+        df.rename(columns=rename_map, inplace=True)
+
+    else:
+        print("   -> Wykryto format: SUROWY (Dukascopy/MT5 bez nagłówka)")
+        # Stara logika dla surowych plików
+        column_names = ['Date_Time', 'Open', 'High', 'Low', 'Close', 'Volume']
+        df = pd.read_csv(filepath, header=None, names=column_names)
         
-        print(f"   -> Gotowe. Załadowano {len(df)} świec (odrzucono {initial_len - len(df)} pustych).")
-        df.sort_index(inplace=True)
+        # Specyficzne czyszczenie daty Dukascopy
+        # Format: 13.01.2025 00:00:00.000 GMT+0100
+        print("   -> Konwersja daty Dukascopy...")
+        df['Date_Time'] = df['Date_Time'].astype(str).str.replace(r' GMT[+-]\d{4}', '', regex=True)
+        df['Date_Time'] = pd.to_datetime(df['Date_Time'], format='%d.%m.%Y %H:%M:%S.%f')
+
+    # --- WSPÓLNA OBRÓBKA DANYCH ---
+    df.set_index('Date_Time', inplace=True)
+    
+    # Konwersja na liczby (dla pewności)
+    cols = ['Open', 'High', 'Low', 'Close', 'Volume']
+    for col in cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    
+    df.dropna(inplace=True)
+    
+    # Filtry jakościowe
+    initial_len = len(df)
+    df = df[df['Volume'] > 0]
+    df = df[df['High'] != df['Low']] # Usunięcie płaskich świec
+    
+    print(f"   -> Gotowe. Załadowano {len(df)} świec (odrzucono {initial_len - len(df)} pustych).")
+    df.sort_index(inplace=True)
+    return df
+
+# --- SHARDY (KATALOG / GLOB) ---
+
+def is_sharded(filepath: str) -> bool:
+    """Katalog albo wzorzec glob (np. 'dane/xauusd_*.csv') zamiast pojedynczego pliku."""
+    return os.path.isdir(filepath) or glob.has_magic(filepath)
+
+def _shard_paths(source: str) -> list:
+    pattern = os.path.join(source, SHARD_PATTERN) if os.path.isdir(source) else source
+    return sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+
+def _shard_cache_path(path: str) -> str:
+    """Plik cache shardu: klucz = rozmiar + mtime, więc zmieniony shard ma inną nazwę."""
+    st = os.stat(path)
+    name = f"{os.path.basename(path)}.{st.st_size}-{st.st_mtime_ns}.pkl"
+    return os.path.join(os.path.dirname(path), SHARD_CACHE_DIR, name)
+
+def _store_shard_cache(path: str, df: pd.DataFrame):
+    cache_path = _shard_cache_path(path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Stare wersje tego shardu nie są już potrzebne
+    stale_pattern = os.path.join(os.path.dirname(cache_path), glob.escape(os.path.basename(path)) + '.*.pkl')
+    for stale in glob.glob(stale_pattern):
+        os.remove(stale)
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_pickle(tmp)
+    os.replace(tmp, cache_path)
+
+def load_shards(source: str, workers=None, use_cache=True) -> pd.DataFrame:
+    """
+    Wczytuje wszystkie shardy (pliki surowe i przetworzone można mieszać),
+    parsując je równolegle, i skleja po czasie. Nakładające się świece
+    (np. styk eksportów rocznych) zostają raz - wygrywa shard wcześniejszy w kolejności nazw.
+    Sparsowane shardy trafiają do <katalog>/.shard_cache - przy kolejnym
+    uruchomieniu parsowane są tylko pliki zmienione od ostatniego razu.
+    """
+    print(f"Wczytuję shardy z {source}...")
+    try:
+        paths = _shard_paths(source)
+        if not paths:
+            raise FileNotFoundError(f"Brak plików pasujących do: {source}")
+
+        frames = {}
+        for path in paths:
+            cache_path = _shard_cache_path(path)
+            if use_cache and os.path.exists(cache_path):
+                frames[path] = pd.read_pickle(cache_path)
+        todo = [p for p in paths if p not in frames]
+        print(f"   -> Shardy: {len(paths)} (z cache: {len(frames)}, do parsowania: {len(todo)})")
+
+        if len(todo) == 1:
+            frames[todo[0]] = _parse_csv(todo[0])
+        elif todo:
+            n_workers = min(workers or os.cpu_count() or 1, len(todo))
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                for path, df in zip(todo, pool.map(_parse_csv, todo)):
+                    frames[path] = df
+        if use_cache:
+            for path in todo:
+                _store_shard_cache(path, frames[path])
+
+        # join='inner': shardy w różnych formatach mogą mieć różne kolumny dodatkowe
+        df = pd.concat([frames[p] for p in paths], join='inner')
+        df.sort_index(kind='stable', inplace=True)
+        duplicated = df.index.duplicated(keep='first')
+        df = df[~duplicated]
+        print(f"   -> Scalono {len(df)} świec z {len(paths)} shardów (usunięto {int(duplicated.sum())} duplikatów).")
         return df
 
     except Exception as e:
@@ -102,6 +193,41 @@ def resample_data(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
         print(f"BŁĄD resamplingu: {e}")
         return pd.DataFrame()
 
+def build_bar_index(raw_index: pd.DatetimeIndex, bar_index: pd.DatetimeIndex, timeframe: str) -> np.ndarray:
+    """
+    Mapuje każdą świecę LTF na zakres wierszy danych surowych.
+    Zakłada posortowany raw_index (loader sortuje) i etykiety świec = początek przedziału.
+    """
+    raw = raw_index.values
+    bar_open = bar_index.values
+    bar_close = (bar_index + pd.Timedelta(timeframe)).values
+    start = np.searchsorted(raw, bar_open, side='left')
+    end = np.searchsorted(raw, bar_close, side='left')
+    return np.column_stack([start, end]).astype(np.int64)
+
+def intrabar_columns(df_raw: pd.DataFrame, bars: pd.DatetimeIndex, timeframe: str) -> pd.DataFrame:
+    """
+    High/Low danych surowych (1-min) każdej świecy LTF jako kolumny Raw_High_i / Raw_Low_i
+    (i = minuta w świecy, brakujące minuty = NaN). Dane jadą razem ze świecami:
+    wycinki WFO, kolejka, pula i odcisk danych obejmują je bez osobnych tablic.
+    """
+    bar_index = build_bar_index(df_raw.index, bars, timeframe)
+    start, end = bar_index[:, 0], bar_index[:, 1]
+    width = int((end - start).max()) if len(bars) else 0
+    rows = start[:, None] + np.arange(width)[None, :]
+    valid = rows < end[:, None]
+    rows = np.minimum(rows, max(len(df_raw) - 1, 0))
+
+    columns = {}
+    for side in ('High', 'Low'):
+        raw = df_raw[side].to_numpy(dtype=float)
+        values = np.where(valid, raw[rows], np.nan)
+        columns.update({f"{RAW_PREFIX[side]}{i}": values[:, i] for i in range(width)})
+    return pd.DataFrame(columns, index=bars)
+
+def has_intrabar(data: pd.DataFrame) -> bool:
+    return data is not None and f"{RAW_PREFIX['High']}0" in data.columns
+
 # ==========================================
 # 2. LOGIKA WSKAŹNIKÓW (BEZ ZMIAN)
 # ==========================================
@@ -110,37 +236,17 @@ def calculate_dorsey_inertia(df, stdev_len=21, smooth_rv=14, smooth_di=14):
     """
     Oblicza wskaźnik Dorsey Inertia na podstawie DataFrame.
     """
-    # Funkcja pomocnicza RVI
-    def rv_idi_original(src_series):
-        stdev = src_series.rolling(window=stdev_len).std()
-        change = src_series.diff()
-        up_mask = change >= 0
-        
-        up_source = pd.Series(0.0, index=src_series.index)
-        down_source = pd.Series(0.0, index=src_series.index)
-        
-        up_source[up_mask] = stdev[up_mask]
-        down_source[~up_mask] = stdev[~up_mask]
-        
-        up_sum = up_source.ewm(span=smooth_rv, adjust=False).mean()
-        down_sum = down_source.ewm(span=smooth_rv, adjust=False).mean()
-        
-        denom = up_sum + down_sum
-        rvi = 100 * up_sum / denom.replace(0, np.nan)
-        return rvi.fillna(50)
-
-    # Obliczamy dla High i Low
-    rvi_high = rv_idi_original(df['High'])
-    rvi_low = rv_idi_original(df['Low'])
-    rv_idi = (rvi_high + rvi_low) / 2
-    
-    # Regresja liniowa (Inertia)
-    inertia = ta.linreg(rv_idi, length=smooth_di)
-    return inertia
+    # RVI dla High i Low + regresja liniowa (Inertia) - natywnie (indicators.py)
+    inertia = ind.dorsey_inertia(df['High'], df['Low'], stdev_len, smooth_rv, smooth_di)
+    return pd.Series(inertia, index=df.index)
 
-def prepare_data_with_indicators(filepath, ltf_res='15min', htf_res='4h'):
+def prepare_data_with_indicators(filepath, ltf_res='15min', htf_res='4h', intrabar=False, rsi_len=7):
     """
     Główna funkcja wywoływana przez backtester.
+    rsi_len: długość RSI (LTF i HTF).
+
+    Przy intrabar=True do świec LTF dochodzą kolumny Raw_High_i / Raw_Low_i
+    (dane 1-min świecy, patrz intrabar_columns) do rozstrzygania SL/TP w świecy.
     """
     df_raw = load_data_from_csv(filepath)
     if df_raw is None or df_raw.empty:
@@ -155,15 +261,15 @@ def prepare_data_with_indicators(filepath, ltf_res='15min', htf_res='4h'):
 
     try:
         # RSI LTF i ATR
-        df_ltf['RSI_LTF'] = ta.rsi(df_ltf['Close'], length=7)
-        df_ltf['ATR'] = ta.atr(df_ltf['High'], df_ltf['Low'], df_ltf['Close'], length=5)
+        df_ltf['RSI_LTF'] = ind.rsi(df_ltf['Close'], rsi_len)[0]
+        df_ltf['ATR'] = ind.atr(df_ltf['High'], df_ltf['Low'], df_ltf['Close'], 5)[0]
 
         # Dorsey Inertia
         df_ltf['Inertia'] = calculate_dorsey_inertia(df_ltf)
 
         # RSI HTF (z zabezpieczeniem shift)
         df_htf = df_raw.resample(htf_res).agg({'Close': 'last'}).dropna()
-        df_htf['RSI_HTF_Calc'] = ta.rsi(df_htf['Close'], length=7)
+        df_htf['RSI_HTF_Calc'] = ind.rsi(df_htf['Close'], rsi_len)[0]
         df_htf['RSI_HTF_Calc'] = df_htf['RSI_HTF_Calc'].shift(1) # Unikamy look-ahead bias
         
         # Merge
@@ -172,6 +278,9 @@ def prepare_data_with_indicators(filepath, ltf_res='15min', htf_res='4h'):
 
         df_final = df_ltf.dropna()
         print(f"Gotowe. Świece po dodaniu wskaźników: {len(df_final)}")
+        if intrabar:
+            # Po dropna - brakujące minuty (NaN) nie mogą usuwać świec
+            df_final = df_final.join(intrabar_columns(df_raw, df_final.index, ltf_res))
         return df_final
 
     except Exception as e:
@@ -179,3 +288,131 @@ def prepare_data_with_indicators(filepath, ltf_res='15min', htf_res='4h'):
         import traceback
         traceback.print_exc()
         return None
+
+# ==========================================
+# 3. POTOK PRZYGOTOWANIA DANYCH (PREFETCH)
+# ==========================================
+
+def _prefetch_worker(conn, filepath, rsi_len, prep_kwargs):
+    """Proces potomny PrepPipeline: przygotowuje jeden wariant i odsyła go rurą."""
+    try:
+        conn.send(prepare_data_with_indicators(filepath, rsi_len=rsi_len, **prep_kwargs))
+    finally:
+        conn.close()
+
+class PrepPipeline:
+    """
+    Producent/konsument dla pętli po RSI Len: gdy bieżąca siatka się liczy,
+    kolejny wariant danych przygotowuje osobny proces. Gotowe zbiory trafiają
+    do małego cache LRU; zbiór przypięty (pin, np. bieżący lider) nie jest
+    wyrzucany, więc raport końcowy nie wczytuje danych ponownie.
+
+        with PrepPipeline(path, [5, 7, 9], intrabar=True) as pipeline:
+            for rsi_len, prepared in pipeline: ...
+            prepared = pipeline.get(best_rsi_len)
+
+    close() / wyjście z with kończy procesy prefetch - także po wyjątku i Ctrl-C
+    (niezamknięty potomek wisi w send() i blokuje zakończenie interpretera).
+
+    Prefetch to goły multiprocessing.Process + Pipe: w procesie rodzica nie żyje
+    żaden wątek pomocniczy (ProcessPoolExecutor trzyma wątek zarządcy), więc
+    fork puli bt.optimize() jest bezpieczny. Wynik odbieramy dopiero w get().
+
+    Kolumny intrabar (Raw_*) nie zależą od RSI Len - liczone są raz w rodzicu
+    i doklejane przy wydaniu zbioru; cache i procesy potomne trzymają tylko
+    kolumny wariantu.
+    """
+
+    def __init__(self, filepath, rsi_lengths, prefetch=1, cache_size=2, intrabar=False, **prep_kwargs):
+        self.filepath = filepath
+        self.rsi_lengths = list(rsi_lengths)
+        self.prefetch = prefetch
+        self.cache_size = cache_size
+        self.prep_kwargs = prep_kwargs
+        self.pinned = None
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._intrabar = self._load_intrabar() if intrabar else None
+
+    def _load_intrabar(self):
+        df_raw = load_data_from_csv(self.filepath)
+        if df_raw is None or df_raw.empty:
+            return None
+        ltf_res = self.prep_kwargs.get('ltf_res', '15min')
+        return intrabar_columns(df_raw, resample_data(df_raw, ltf_res).index, ltf_res)
+
+    def _with_intrabar(self, prepared):
+        if prepared is None or self._intrabar is None:
+            return prepared
+        raw = self._intrabar.reindex(prepared.index)
+        # Szerokość jak w prepare_data_with_indicators(intrabar=True): najdłuższa świeca zbioru
+        return prepared.join(raw.loc[:, raw.notna().any()])
+
+    def _prepare(self, rsi_len):
+        return prepare_data_with_indicators(self.filepath, rsi_len=rsi_len, **self.prep_kwargs)
+
+    def _submit(self, rsi_len):
+        if rsi_len in self._cache or rsi_len in self._pending or self.prefetch <= 0:
+            return
+        recv, send = mp.Pipe(duplex=False)
+        # Nie daemon: load_shards w potomku może uruchomić własną pulę procesów
+        proc = mp.Process(target=_prefetch_worker, args=(send, self.filepath, rsi_len, self.prep_kwargs))
+        proc.start()
+        send.close()
+        self._pending[rsi_len] = (proc, recv)
+
+    def _collect(self, rsi_len):
+        proc, recv = self._pending.pop(rsi_len)
+        try:
+            prepared = recv.recv()
+        except (EOFError, OSError):  # proces padł przed/w trakcie wysyłki
+            prepared = None
+        finally:
+            recv.close()
+            proc.join()
+        if proc.exitcode != 0:
+            print(f"⚠️ Prefetch RSI Len {rsi_len} przerwany (kod {proc.exitcode}) - przygotowuję ponownie.")
+            prepared = self._prepare(rsi_len)
+        return prepared
+
+    def _store(self, rsi_len, prepared):
+        self._cache[rsi_len] = prepared
+        self._cache.move_to_end(rsi_len)
+        evictable = [k for k in self._cache if k != self.pinned]
+        while len(self._cache) > self.cache_size + (self.pinned in self._cache) and evictable:
+            del self._cache[evictable.pop(0)]
+
+    def get(self, rsi_len):
+        if rsi_len in self._cache:
+            self._cache.move_to_end(rsi_len)
+            return self._with_intrabar(self._cache[rsi_len])
+        if rsi_len in self._pending:
+            prepared = self._collect(rsi_len)
+        else:
+            prepared = self._prepare(rsi_len)
+        self._store(rsi_len, prepared)
+        return self._with_intrabar(prepared)
+
+    def pin(self, rsi_len):
+        """Ten zbiór zostaje w cache niezależnie od limitu (poprzednio przypięty - już nie)."""
+        self.pinned = rsi_len
+
+    def __iter__(self):
+        for i, rsi_len in enumerate(self.rsi_lengths):
+            # Kolejne warianty liczą się w tle, gdy konsument optymalizuje bieżący
+            for ahead in self.rsi_lengths[i + 1:i + 1 + self.prefetch]:
+                self._submit(ahead)
+            yield rsi_len, self.get(rsi_len)
+
+    def close(self):
+        for proc, recv in self._pending.values():
+            recv.close()
+            proc.terminate()
+            proc.join()
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
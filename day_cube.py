@@ -0,0 +1,200 @@
+import json
+import numpy as np
+import pandas as pd
+from scoring import MIN_TRADES, score_formula
+
+# ==========================================
+# KOSTKA DZIENNA: (ZESTAW PARAMETRÓW x DZIEŃ)
+# ==========================================
+# Dla każdego ocenionego zestawu parametrów trzymamy agregaty dzienne
+# (PnL, transakcje, wygrane, kapitał: zamknięcie/max/min dnia). Pytania
+# o dowolny zakres dat to różnica sum prefiksowych, a o reżim (np. dni
+# z wysokim ATR) - suma po masce dni. Bez ponownych backtestów i bez świec.
+#
+# Transakcje przypisujemy do dnia wyjścia (wtedy PnL jest zrealizowany).
+
+SUM_FIELDS = ('pnl', 'trades', 'wins')
+EQUITY_FIELDS = ('eq_close', 'eq_high', 'eq_low')
+FIELDS = SUM_FIELDS + EQUITY_FIELDS
+
+def daily_stats(stats) -> pd.DataFrame:
+    """Wynik bt.run() -> DataFrame dzienny (indeks: dzień) z kolumnami FIELDS."""
+    equity = stats['_equity_curve']['Equity']
+    daily = equity.groupby(equity.index.normalize()).agg(['last', 'max', 'min'])
+    daily.columns = list(EQUITY_FIELDS)
+
+    trades = stats['_trades']
+    exit_day = pd.DatetimeIndex(trades['ExitTime']).normalize()
+    pnl = trades['PnL'].to_numpy(dtype=float)
+    per_trade = pd.DataFrame({'pnl': pnl, 'trades': 1.0, 'wins': (pnl > 0).astype(float)}, index=exit_day)
+    daily = daily.join(per_trade.groupby(level=0).sum())
+    daily[list(SUM_FIELDS)] = daily[list(SUM_FIELDS)].fillna(0.0)
+    return daily[list(FIELDS)]
+
+def daily_rows(stats) -> dict:
+    """daily_stats w formie kolumnowej do JSON (wyniki workerów kolejki / puli)."""
+    daily = daily_stats(stats)
+    out = {'days': [d.strftime('%Y-%m-%d') for d in daily.index]}
+    out.update({f: daily[f].round(6).tolist() for f in FIELDS})
+    return out
+
+def _rows_to_frame(rows: dict) -> pd.DataFrame:
+    return pd.DataFrame({f: rows[f] for f in FIELDS}, index=pd.DatetimeIndex(rows['days']))
+
+def atr_regimes(data: pd.DataFrame, q=4, column='ATR') -> pd.Series:
+    """Etykieta reżimu zmienności dnia: kwantyl średniego ATR/Close (Q1 = najspokojniejsze dni)."""
+    daily = (data[column] / data['Close']).groupby(data.index.normalize()).mean()
+    return pd.qcut(daily, q, labels=[f"Q{i + 1}" for i in range(q)])
+
+
+class DayCube:
+    """
+    values[field][p, d] dla zestawów parametrów p i dni d.
+    keys: nazwy zestawów (np. numer kombinacji), params: opcjonalny DataFrame parametrów (indeks = keys).
+    """
+
+    def __init__(self, keys, days, values: dict, cash=100000, params=None):
+        self.keys = list(keys)
+        self.days = pd.DatetimeIndex(days)
+        self.values = values
+        self.cash = float(cash)
+        self.params = params
+        # Sumy prefiksowe: prefix[f][:, d] = suma dni [0, d)
+        self._prefix = {f: np.concatenate([np.zeros((len(self.keys), 1)), np.cumsum(values[f], axis=1)], axis=1)
+                        for f in SUM_FIELDS}
+
+    @classmethod
+    def from_daily(cls, daily: dict, cash=100000, params=None) -> 'DayCube':
+        """daily: nazwa -> DataFrame z daily_stats()."""
+        keys = list(daily)
+        days = pd.DatetimeIndex(sorted(set().union(*(d.index for d in daily.values())))) if daily else pd.DatetimeIndex([])
+        values = {f: np.zeros((len(keys), len(days))) for f in FIELDS}
+        for i, key in enumerate(keys):
+            frame = daily[key].reindex(days)
+            for f in SUM_FIELDS:
+                values[f][i] = frame[f].fillna(0.0).to_numpy()
+            # Dni bez świec (weekendy) - kapitał z poprzedniego dnia, przed startem - kapitał początkowy
+            close = frame['eq_close'].ffill().fillna(cash).to_numpy()
+            values['eq_close'][i] = close
+            values['eq_high'][i] = frame['eq_high'].fillna(pd.Series(close, index=days)).to_numpy()
+            values['eq_low'][i] = frame['eq_low'].fillna(pd.Series(close, index=days)).to_numpy()
+        return cls(keys, days, values, cash=cash, params=params)
+
+    @classmethod
+    def from_stats(cls, stats: dict, cash=100000) -> 'DayCube':
+        """stats: nazwa -> wynik bt.run()."""
+        return cls.from_daily({k: daily_stats(s) for k, s in stats.items()}, cash=cash)
+
+    @classmethod
+    def from_results(cls, job, results: pd.DataFrame, cash=100000) -> 'DayCube':
+        """Wyniki siatki (collect() / SharedGridPool.run(daily=True)) -> kostka; klucz = numer kombinacji."""
+        daily = {i: _rows_to_frame(rows) for i, rows in results['daily'].items() if isinstance(rows, dict)}
+        params = pd.DataFrame(job['combos']).loc[list(daily)]
+        return cls.from_daily(daily, cash=cash, params=params)
+
+    @classmethod
+    def concat(cls, cubes: dict, name='set') -> 'DayCube':
+        """
+        Kilka kostek (np. po jednej na RSI Len albo okno WFO) -> jedna, na sumie dni.
+        Klucze numerowane od nowa; kolumna params[name] mówi, z której kostki jest zestaw.
+        """
+        daily, params = {}, []
+        for label, cube in cubes.items():
+            for i in range(len(cube.keys)):
+                daily[len(daily)] = pd.DataFrame({f: cube.values[f][i] for f in FIELDS}, index=cube.days)
+            p = cube.params if cube.params is not None else pd.DataFrame(index=cube.keys)
+            params.append(p.reset_index(drop=True).assign(**{name: label}))
+        cash = next(iter(cubes.values())).cash if cubes else 100000
+        return cls.from_daily(daily, cash=cash, params=pd.concat(params, ignore_index=True) if params else None)
+
+    def __repr__(self):
+        span = f"{self.days[0].date()} -> {self.days[-1].date()}" if len(self.days) else "pusta"
+        return f"<DayCube zestawów: {len(self.keys)}, dni: {len(self.days)} ({span})>"
+
+    # --- ZAPYTANIA ---
+
+    def _table(self, sums, min_trades, extra=None) -> pd.DataFrame:
+        trades = sums['trades']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            win_rate = np.where(trades > 0, sums['wins'] / trades * 100, np.nan)
+        table = pd.DataFrame({
+            'net_profit': sums['pnl'],
+            'trades': trades.astype(int),
+            'win_rate': win_rate,
+            'optim_score': score_formula(win_rate, trades, min_trades),
+        }, index=pd.Index(self.keys, name='key'))
+        for name, column in (extra or {}).items():
+            table[name] = column
+        if self.params is not None:
+            table = self.params.join(table)
+        return table
+
+    def _day_range(self, start=None, end=None):
+        """Zakres dni [d0, d1) dla dat start..end włącznie (jak data.loc[start:end])."""
+        d0 = 0 if start is None else int(self.days.searchsorted(pd.Timestamp(start).normalize(), side='left'))
+        d1 = len(self.days) if end is None else int(self.days.searchsorted(pd.Timestamp(end).normalize(), side='right'))
+        return d0, d1
+
+    def query(self, start=None, end=None, min_trades=MIN_TRADES) -> pd.DataFrame:
+        """
+        Wyniki wszystkich zestawów w zakresie dat: sumy z prefiksów (O(1) na zestaw),
+        szczyt kapitału i maks. obsunięcie [%] z dziennych max/min kapitału.
+
+        max_drawdown to GÓRNE OSZACOWANIE: kostka nie zna kolejności w ciągu dnia,
+        więc zakłada, że dzienny szczyt był przed dziennym dołkiem. Rzeczywiste
+        obsunięcie (np. stats['Max. Drawdown [%]'] z bt.run) może być mniejsze.
+        """
+        d0, d1 = self._day_range(start, end)
+        sums = {f: self._prefix[f][:, d1] - self._prefix[f][:, d0] for f in SUM_FIELDS}
+
+        extra = {'equity_hwm': np.full(len(self.keys), np.nan), 'max_drawdown': np.full(len(self.keys), np.nan)}
+        if d1 > d0:
+            start_equity = self.values['eq_close'][:, d0 - 1] if d0 > 0 else np.full(len(self.keys), self.cash)
+            peak = np.maximum(np.maximum.accumulate(self.values['eq_high'][:, d0:d1], axis=1), start_equity[:, None])
+            extra['equity_hwm'] = peak[:, -1]
+            # Szczyt dnia liczony przed jego dołkiem - górne oszacowanie obsunięcia
+            extra['max_drawdown'] = ((peak - self.values['eq_low'][:, d0:d1]) / peak).max(axis=1) * 100
+        return self._table(sums, min_trades, extra)
+
+    def regime(self, day_mask, min_trades=MIN_TRADES) -> pd.DataFrame:
+        """Wyniki tylko z dni, dla których day_mask jest True (tablica bool dla self.days lub Series dzień -> bool)."""
+        if isinstance(day_mask, pd.Series):
+            day_mask = day_mask.reindex(self.days, fill_value=False).to_numpy(dtype=bool)
+        mask = np.asarray(day_mask, dtype=float)
+        sums = {f: self.values[f] @ mask for f in SUM_FIELDS}
+        return self._table(sums, min_trades, {'days': int(mask.sum())})
+
+    def by_regime(self, labels: pd.Series, min_trades=MIN_TRADES) -> pd.DataFrame:
+        """Tabela (etykieta reżimu, zestaw) - np. labels = atr_regimes(data)."""
+        labels = labels.reindex(self.days)
+        frames = {label: self.regime((labels == label).to_numpy(), min_trades)
+                  for label in labels.dropna().unique()}
+        return pd.concat(frames, names=['regime']).sort_index(level=0)
+
+    def by_period(self, freq='M', min_trades=MIN_TRADES) -> pd.DataFrame:
+        """Tabela (okres, zestaw) - freq jak w pd.Period: 'M' miesiące, 'Q' kwartały, 'W' tygodnie."""
+        periods = self.days.to_period(freq)
+        frames = {}
+        for period in periods.unique():
+            days = self.days[periods == period]
+            frames[str(period)] = self.query(days[0], days[-1], min_trades)
+        return pd.concat(frames, names=['period'])
+
+    # --- ZAPIS / ODCZYT ---
+
+    def save(self, path):
+        np.savez(f"{path}.npz", days=self.days.values, **self.values)
+        meta = {'keys': self.keys, 'cash': self.cash,
+                'params': self.params.to_dict(orient='list') if self.params is not None else None}
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, default=str)
+
+    @classmethod
+    def load(cls, path) -> 'DayCube':
+        with open(f"{path}.json", encoding='utf-8') as f:
+            meta = json.load(f)
+        with np.load(f"{path}.npz") as npz:
+            values = {f: npz[f] for f in FIELDS}
+            days = npz['days']
+        params = pd.DataFrame(meta['params'], index=meta['keys']) if meta['params'] is not None else None
+        return cls(meta['keys'], days, values, cash=meta['cash'], params=params)
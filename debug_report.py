@@ -2,11 +2,14 @@ from backtesting import Backtest
 import pandas as pd
 import os
 import sys
+import time
 
 # --- IMPORT TWOICH MODUŁÓW ---
 try:
     from strategies import Strategy2xRSI_Dorsey
     from data_loader import prepare_data_with_indicators
+    from signal_funnel import signal_funnel, funnel_grid, print_funnel
+    from day_cube import DayCube, atr_regimes
     print("✅ Moduły strategies i data_loader załadowane poprawnie.")
 except ImportError as e:
     print(f"❌ BŁĄD IMPORTU: {e}")
@@ -27,6 +30,20 @@ PARAMS = {
     'di_level_long': 50
 }
 
+# Tryb: 'backtest' - pełny bt.run() + raport HTML,
+#       'funnel'   - lejek sygnałów: ile świec i kandydatów na wejście odrzuca każdy warunek next() (bez backtestu)
+#       'cube'     - pytania do zapisanej kostki dziennej siatki: okres i reżimy ATR (bez backtestu)
+MODE = 'backtest'
+
+# Siatka dla trybu 'funnel' (jak w bt.optimize) - None = tylko PARAMS
+FUNNEL_GRID = None
+# FUNNEL_GRID = {'rsi_delta_ltf': [6, 8, 10], 'rsi_delta_htf': [5, 10, 15], 'atr_min_percent': [0.0003, 0.0005]}
+
+# Kostka dzienna dla trybu 'cube' (backtester.py z GRID_WORKERS > 0 -> config.DAY_CUBE_PATH,
+# albo <CHECKPOINT_DIR>/<klucz okna>/day_cube z WFO_opti.py)
+DAY_CUBE_PATH = "day_cube"
+CUBE_TOP = 10   # Ile najlepszych zestawów pokazać
+
 def run_debug():
     print("\n--- DIAGNOSTYKA ROZPOCZĘTA ---")
     
@@ -70,6 +87,13 @@ def run_debug():
     
     print(f"✅ Wycięto podzbiór. Liczba świec do testu: {len(subset)}")
 
+    if MODE == 'funnel':
+        run_funnel(subset)
+        return
+    if MODE == 'cube':
+        run_cube(subset, start_date, end_date)
+        return
+
     # 4. Backtest
     print("\n🚀 Uruchamiam Backtest...")
     try:
@@ -94,5 +118,42 @@ def run_debug():
     except Exception as e:
         print(f"❌ BŁĄD generowania wykresu: {e}")
 
+def run_funnel(subset):
+    """Lejek sygnałów dla PARAMS (i opcjonalnie FUNNEL_GRID) - maski na całej historii naraz."""
+    print("\n🔍 Lejek sygnałów (bez backtestu)...")
+    t0 = time.perf_counter()
+    print_funnel(signal_funnel(subset, PARAMS))
+
+    if FUNNEL_GRID:
+        grid = funnel_grid(subset, FUNNEL_GRID, base_params=PARAMS)
+        grid['signals'] = grid['signals_long'] + grid['signals_short']
+        print(f"\n📊 Siatka: {len(grid)} kombinacji (od najmniejszej liczby sygnałów):")
+        print(grid.sort_values('signals').to_string(index=False))
+    print(f"\n⏱️ Diagnostyka zakończona w {time.perf_counter() - t0:.2f}s")
+
+def run_cube(subset, start_date, end_date):
+    """Zapytania do kostki dziennej: wycięty okres i reżimy ATR dni z subset (sumy prefiksowe, bez backtestu)."""
+    print(f"\n🧊 Kostka dzienna: {DAY_CUBE_PATH}")
+    try:
+        cube = DayCube.load(DAY_CUBE_PATH)
+    except FileNotFoundError:
+        print(f"❌ BŁĄD: Brak plików {DAY_CUBE_PATH}.npz / .json")
+        return
+    print(f"✅ {cube}")
+    t0 = time.perf_counter()
+
+    period = cube.query(start_date, end_date)
+    print(f"\n📅 Okres {start_date} -> {end_date}: TOP {CUBE_TOP} zestawów wg optim_score")
+    ranking = ['optim_score', 'net_profit']  # przy ocenie -1 (za mało transakcji) decyduje zysk
+    print(period.sort_values(ranking, ascending=False).head(CUBE_TOP).round(2).to_string())
+    print("   ℹ️ max_drawdown to górne oszacowanie (z dziennych max/min kapitału, bez kolejności w ciągu dnia)")
+
+    # Reżim dnia = kwartyl średniego ATR/Close (Q1 = najspokojniejsze dni)
+    regimes = cube.by_regime(atr_regimes(subset))
+    print(f"\n🌡️ Reżimy ATR: TOP 3 zestawy w każdym")
+    best = regimes.groupby(level='regime', group_keys=False).apply(lambda g: g.sort_values(ranking, ascending=False).head(3))
+    print(best.round(2).to_string())
+    print(f"\n⏱️ Zapytania w {time.perf_counter() - t0:.3f}s")
+
 if __name__ == "__main__":
     run_debug()
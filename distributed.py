@@ -0,0 +1,325 @@
+import hashlib
+import importlib
+import json
+import math
+import os
+import pickle
+import socket
+import sys
+import time
+import numpy as np
+import pandas as pd
+from data_loader import has_intrabar
+from common import atomic_write, grid_combinations, plain
+
+# ==========================================
+# ROZPROSZONA OPTYMALIZACJA (KOLEJKA W KATALOGU)
+# ==========================================
+# Koordynator publikuje przygotowane dane (raz, po odcisku) i wrzuca zadania
+# (odcisk danych, okno wierszy, paczka kombinacji) do wspólnego katalogu.
+# Workery na dowolnym hoście z dostępem do katalogu (dysk sieciowy / NFS / SMB)
+# przejmują zadania atomowym os.rename(), liczą i odkładają wyniki.
+#
+#   <root>/data/<fingerprint>.pkl   - przygotowany DataFrame (z kolumnami intrabar Raw_*, jeśli są)
+#   <root>/pending/<task>.json      - zadania do wzięcia
+#   <root>/running/<task>.json      - zadania w toku (mtime = heartbeat)
+#   <root>/results/<task>.json      - wyniki
+#   <root>/failed/<task>.json       - zadania po wyczerpaniu prób
+#
+# Worker:  python distributed.py <root> [worker_id]
+
+DEFAULT_STRATEGY = 'strategies:Strategy2xRSI_Dorsey'
+STALE_AFTER = 600       # [s] bez heartbeat -> zadanie wraca do kolejki
+MAX_RETRIES = 3
+
+def dataset_fingerprint(data: pd.DataFrame) -> str:
+    """
+    Odcisk treści przygotowanych danych (indeks + wszystkie kolumny, w tym dane intrabar Raw_*).
+    Dane z intrabar i bez mają różne kolumny -> różne odciski (i różne zlecenia).
+    """
+    hashed = pd.util.hash_pandas_object(data, index=True).to_numpy()
+    h = hashlib.sha1(hashed.tobytes())
+    h.update(','.join(map(str, data.columns)).encode())
+    return h.hexdigest()[:16]
+
+def _load_object(path: str):
+    """'modul:atrybut' -> obiekt (strategia, funkcja oceny)."""
+    module, attr = path.split(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+class DirQueue:
+    """Kolejka zadań oparta o katalog (atomowe os.rename w obrębie jednego systemu plików)."""
+
+    SUBDIRS = ('data', 'pending', 'running', 'results', 'failed')
+
+    def __init__(self, root):
+        self.root = root
+        for sub in self.SUBDIRS:
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub, name):
+        return os.path.join(self.root, sub, name)
+
+    # --- DANE ---
+
+    def publish_dataset(self, data: pd.DataFrame) -> str:
+        fingerprint = dataset_fingerprint(data)
+        path = self._path('data', f"{fingerprint}.pkl")
+        if not os.path.exists(path):
+            atomic_write(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        return fingerprint
+
+    def load_dataset(self, fingerprint):
+        with open(self._path('data', f"{fingerprint}.pkl"), 'rb') as f:
+            return pickle.load(f)
+
+    # --- ZADANIA ---
+
+    def put(self, task: dict):
+        name = f"{task['id']}.json"
+        # Zadanie już policzone (np. ponowne uruchomienie tej samej siatki) - nie dublujemy
+        if os.path.exists(self._path('results', name)):
+            return
+        atomic_write(self._path('pending', name), json.dumps(task).encode())
+        # Porażka z wcześniejszego przebiegu nie może blokować collect() ponownie wrzuconego zadania
+        try:
+            os.remove(self._path('failed', name))
+        except FileNotFoundError:
+            pass
+
+    def claim(self):
+        for name in sorted(os.listdir(self._path('pending', ''))):
+            if not name.endswith('.json'):
+                continue
+            try:
+                os.rename(self._path('pending', name), self._path('running', name))
+            except (FileNotFoundError, PermissionError):
+                continue  # Inny worker był szybszy
+            with open(self._path('running', name), encoding='utf-8') as f:
+                return json.load(f)
+        return None
+
+    def heartbeat(self, task):
+        try:
+            os.utime(self._path('running', f"{task['id']}.json"))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task, rows):
+        name = f"{task['id']}.json"
+        atomic_write(self._path('results', name), json.dumps(rows).encode())
+        try:
+            os.remove(self._path('running', name))
+        except FileNotFoundError:
+            pass
+
+    def fail(self, task, error, max_retries=MAX_RETRIES):
+        name = f"{task['id']}.json"
+        task = dict(task, attempts=task.get('attempts', 0) + 1, error=error)
+        target = 'pending' if task['attempts'] < max_retries else 'failed'
+        atomic_write(self._path(target, name), json.dumps(task).encode())
+        try:
+            os.remove(self._path('running', name))
+        except FileNotFoundError:
+            pass
+
+    def requeue_stale(self, stale_after=STALE_AFTER, max_retries=MAX_RETRIES):
+        """
+        Zadania bez heartbeat (padnięty worker/host) wracają do pending jak po fail():
+        z licznikiem prób, a po max_retries trafiają do failed (zadanie wywracające workera
+        nie krąży w nieskończoność).
+        """
+        now = time.time()
+        for name in os.listdir(self._path('running', '')):
+            path = self._path('running', name)
+            try:
+                if now - os.path.getmtime(path) <= stale_after:
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    task = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue  # Zakończone w międzyczasie / zapis w toku
+            self.fail(task, f"brak heartbeat przez {stale_after}s", max_retries=max_retries)
+
+    def status(self, task_ids):
+        done = failed = 0
+        for tid in task_ids:
+            if os.path.exists(self._path('results', f"{tid}.json")):
+                done += 1
+            elif os.path.exists(self._path('failed', f"{tid}.json")):
+                failed += 1
+        return done, failed
+
+    def results(self, task_id):
+        with open(self._path('results', f"{task_id}.json"), encoding='utf-8') as f:
+            return json.load(f)
+
+
+# ==========================================
+# KOORDYNATOR
+# ==========================================
+
+def submit_grid(queue: DirQueue, fingerprint, param_grid, window=None, chunk_size=20,
+                maximize='Equity Final [$]', strategy=DEFAULT_STRATEGY, bt_kwargs=None, daily=False, intrabar=False,
+                trades=False):
+    """
+    Dzieli siatkę na paczki i wrzuca zadania do kolejki.
+    window: lista zakresów wierszy [(start, end), ...] (np. z DayIndex.row_ranges) lub None = całość.
+    maximize: nazwa kolumny statystyk albo 'modul:funkcja'.
+    intrabar: czy opublikowane dane mają kolumny intrabar (has_intrabar) - część id zlecenia,
+    worker sprawdza zgodność z danymi.
+    daily=True: wiersze wyników dostają agregaty dzienne (kolumna 'daily' -> day_cube.DayCube.from_results).
+    trades=True: wiersze wyników dostają listę transakcji (kolumna 'trade_list' -> costs.reprice).
+    Zwraca opis zlecenia (job) do collect().
+    """
+    combos = [{k: plain(v) for k, v in c.items()} for c in grid_combinations(param_grid)]
+    window = [list(map(int, w)) for w in window] if window else None
+    spec = {
+        'dataset': fingerprint, 'window': window, 'maximize': maximize,
+        'strategy': strategy, 'bt_kwargs': bt_kwargs or {}, 'intrabar': bool(intrabar),
+    }
+    # Tylko gdy włączone - id starszych zleceń bez zmian
+    if daily:
+        spec['daily'] = True
+    if trades:
+        spec['trades'] = True
+    job_id = hashlib.sha1(json.dumps([spec, combos], sort_keys=True).encode()).hexdigest()[:16]
+
+    task_ids = []
+    for chunk, lo in enumerate(range(0, len(combos), chunk_size)):
+        task_id = f"{job_id}-{chunk:05d}"
+        queue.put(dict(spec, id=task_id, first=lo, params=combos[lo:lo + chunk_size], attempts=0))
+        task_ids.append(task_id)
+
+    return {'id': job_id, 'tasks': task_ids, 'combos': combos}
+
+def collect(queue: DirQueue, job, poll=2.0, stale_after=STALE_AFTER, timeout=None) -> pd.DataFrame:
+    """
+    Czeka na komplet wyników zlecenia i zwraca DataFrame (jeden wiersz na kombinację,
+    w kolejności siatki). Zadania porzucone przez workery wracają do kolejki.
+    """
+    started = time.time()
+    while True:
+        done, failed = queue.status(job['tasks'])
+        if failed:
+            raise RuntimeError(f"{failed} zadań zlecenia {job['id']} nie powiodło się po {MAX_RETRIES} próbach "
+                               f"(szczegóły: {os.path.join(queue.root, 'failed')})")
+        if done == len(job['tasks']):
+            break
+        if timeout is not None and time.time() - started > timeout:
+            raise TimeoutError(f"Zlecenie {job['id']}: {done}/{len(job['tasks'])} zadań po {timeout}s")
+        queue.requeue_stale(stale_after)
+        time.sleep(poll)
+
+    rows = [row for tid in job['tasks'] for row in queue.results(tid)]
+    df = pd.DataFrame(rows).set_index('combo').sort_index()
+    params = pd.DataFrame(job['combos'])
+    return params.join(df)
+
+def best_params(job, results: pd.DataFrame) -> dict:
+    """
+    Wybór jak w pętli jednowęzłowej: pierwsze maksimum w kolejności siatki,
+    a gdy nic się nie policzyło - pierwsza kombinacja.
+    """
+    values = results['value'].to_numpy(dtype=float)
+    if np.isnan(values).all():
+        return job['combos'][0]
+    return job['combos'][int(np.nanargmax(values))]
+
+def start_local_workers(root, n=None):
+    """Workery na tej maszynie (procesy w tle). Zwraca listę procesów."""
+    import multiprocessing
+    n = n or os.cpu_count() or 1
+    procs = [multiprocessing.Process(target=run_worker, args=(root, f"{socket.gethostname()}-local{i}"),
+                                     kwargs={'max_idle': 30}, daemon=True)
+             for i in range(n)]
+    for p in procs:
+        p.start()
+    return procs
+
+
+# ==========================================
+# WORKER
+# ==========================================
+
+def _run_task(queue: DirQueue, task, cache):
+    if task['dataset'] not in cache:
+        cache.clear()  # Trzymamy tylko bieżący zbiór - pamięć workera stała
+        cache[task['dataset']] = queue.load_dataset(task['dataset'])
+    return evaluate_chunk(cache[task['dataset']], task, heartbeat=lambda: queue.heartbeat(task))
+
+def evaluate_chunk(data, task, heartbeat=None):
+    """
+    Liczy paczkę kombinacji zadania (window, strategy, maximize, bt_kwargs, first, params)
+    na gotowych danych. Wspólne dla workerów kolejki i puli shared_data.SharedGridPool.
+    Jak manual_optimization_windows: kombinacja bez transakcji też dostaje ocenę
+    (bt.optimize zostawia ją NaN - patrz backtester.pool_optimize).
+    """
+    from backtesting import Backtest
+    from day_cube import daily_rows
+    from scoring import trade_columns
+
+    if 'intrabar' in task and task['intrabar'] != has_intrabar(data):
+        raise ValueError(f"intrabar={task['intrabar']} w zadaniu, a dane "
+                         f"{'mają' if has_intrabar(data) else 'nie mają'} kolumn intrabar")
+    if task['window']:
+        parts = [data.iloc[lo:hi] for lo, hi in task['window']]
+        data = parts[0] if len(parts) == 1 else pd.concat(parts)
+
+    strategy_class = _load_object(task['strategy'])
+
+    maximize = task['maximize']
+    objective = _load_object(maximize) if ':' in maximize else None
+
+    bt = Backtest(data, strategy_class, **task['bt_kwargs'])
+    rows = []
+    for i, params in enumerate(task['params']):
+        row = {'combo': task['first'] + i, 'value': math.nan, 'trades': 0}
+        try:
+            stats = bt.run(**params)
+            row['value'] = float(objective(stats) if objective else stats[maximize])
+            row['trades'] = int(stats['# Trades'])
+            row['equity'] = float(stats['Equity Final [$]'])
+            if task.get('daily'):
+                row['daily'] = daily_rows(stats)
+            if task.get('trades'):
+                row['trade_list'] = trade_columns(stats)
+        except Exception:
+            pass  # Jak w pętli jednowęzłowej: błędna kombinacja jest pomijana
+        rows.append(row)
+        if heartbeat:
+            heartbeat()
+    return rows
+
+def run_worker(root, worker_id=None, poll=1.0, max_idle=None):
+    """
+    Pętla workera. max_idle: po tylu sekundach bez zadań worker kończy pracę
+    (None = działa do przerwania).
+    """
+    queue = DirQueue(root)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    cache = {}
+    idle_since = time.time()
+    print(f"👷 Worker {worker_id} -> {root}")
+
+    while True:
+        task = queue.claim()
+        if task is None:
+            if max_idle is not None and time.time() - idle_since > max_idle:
+                break
+            time.sleep(poll)
+            continue
+
+        try:
+            queue.complete(task, _run_task(queue, task, cache))
+        except Exception as e:
+            print(f"❌ [{worker_id}] Zadanie {task['id']}: {e}")
+            queue.fail(task, f"{worker_id}: {e!r}")
+        idle_since = time.time()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Użycie: python distributed.py <katalog_kolejki> [worker_id]")
+        sys.exit(1)
+    run_worker(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
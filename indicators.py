@@ -0,0 +1,342 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# WSKAŹNIKI NATYWNE (numpy, BATCH PO DŁUGOŚCIACH)
+# ==========================================
+# Zamiennik pandas_ta na gorącej ścieżce: tablica na wejściu, tablica na wyjściu.
+# Każda funkcja przyjmuje wektor długości i zwraca macierz (len(lengths), N)
+# - jeden wiersz na długość. Wyniki zgodne z pandas_ta (ścieżka bez TA-Lib,
+# wartości domyślne pandas_ta 0.4) - sprawdzenie: python indicators.py [plik.csv]
+
+def _lengths(lengths) -> np.ndarray:
+    return np.atleast_1d(np.asarray(lengths, dtype=np.int64))
+
+def _rows(x, n_rows) -> np.ndarray:
+    """Wejście 1-D (wspólne dla wszystkich długości) lub 2-D (wiersz na długość)."""
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        return np.broadcast_to(x, (n_rows, len(x)))
+    assert x.shape[0] == n_rows, f"Wierszy {x.shape[0]} != długości {n_rows}"
+    return x
+
+def _diff(x) -> np.ndarray:
+    out = np.empty_like(x, dtype=float)
+    out[..., 0] = np.nan
+    out[..., 1:] = x[..., 1:] - x[..., :-1]
+    return out
+
+def _linear_filter(x, d, g, y_prev):
+    """
+    y_t = d * y_{t-1} + g * x_t dla każdego wiersza (bez NaN w x).
+    Liczone blokami w postaci zamkniętej (cumsum), żeby nie iterować po świecach.
+    Blok dobrany tak, by d^-blok nie przekroczyło 1e100.
+    """
+    n_rows, n = x.shape
+    out = np.empty((n_rows, n))
+    if n == 0:
+        return out
+    d = d[:, None]
+    if np.any(d <= 0):
+        block = 1
+    else:
+        block = int(np.clip(100 / np.max(-np.log10(d)), 1, 4096))
+    powers = d ** np.arange(block)
+
+    for lo in range(0, n, block):
+        xb = x[:, lo:lo + block]
+        pw = powers[:, :xb.shape[1]]
+        yb = pw * (d * y_prev[:, None] + g[:, None] * np.cumsum(xb / pw, axis=1))
+        out[:, lo:lo + block] = yb
+        y_prev = yb[:, -1]
+    return out
+
+def _ewm(x, alphas, adjust=False, min_periods=0):
+    """
+    Odpowiednik Series.ewm(alpha=..., adjust=..., min_periods=...).mean() (ignore_na=False)
+    dla macierzy (wiersz na alpha). Początkowy fragment z NaN liczony pętlą jak w pandas
+    (wagi zależne od pozycji), reszta - filtrem liniowym.
+    """
+    x = np.asarray(x, dtype=float)
+    n_rows, n = x.shape
+    alphas = np.asarray(alphas, dtype=float)
+    d = 1.0 - alphas
+    new_wt = np.ones(n_rows) if adjust else alphas.copy()
+    # pandas: przy adjust=False i com == 1 (alpha 0.5) waga nowej obserwacji = 1 - old_wt
+    com_one = np.full(n_rows, not adjust) & (alphas == 0.5)
+    out = np.empty((n_rows, n))
+
+    # Prefiks: do ostatniego NaN + 1 obserwacja (stan old_wt wraca wtedy do normy)
+    nan_cols = np.flatnonzero(np.isnan(x).any(axis=0))
+    prefix = min(n, (nan_cols[-1] + 2) if len(nan_cols) else 1)
+
+    weighted = np.full(n_rows, np.nan)
+    old_wt = np.ones(n_rows)
+    for t in range(prefix):
+        cur = x[:, t]
+        obs = ~np.isnan(cur)
+        started = ~np.isnan(weighted)
+
+        old_wt = np.where(started, old_wt * d, old_wt)
+        new_wt = np.where(started & com_one, 1.0 - old_wt, new_wt)
+        mix = started & obs
+        with np.errstate(invalid='ignore'):
+            mixed = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+        weighted = np.where(mix, mixed, weighted)
+        if adjust:
+            old_wt = np.where(mix, old_wt + new_wt, old_wt)
+        else:
+            old_wt = np.where(mix, 1.0, old_wt)
+        weighted = np.where(~started & obs, cur, weighted)
+        out[:, t] = weighted
+
+    if prefix < n:
+        tail = x[:, prefix:]
+        if adjust:
+            # N_t = d*N_{t-1} + x_t, W_t = d*W_{t-1} + 1, y = N / W
+            num = _linear_filter(tail, d, np.ones(n_rows), old_wt * weighted)
+            den = _linear_filter(np.ones_like(tail), d, np.ones(n_rows), old_wt)
+            out[:, prefix:] = num / den
+        else:
+            out[:, prefix:] = _linear_filter(tail, d, alphas, weighted)
+
+    if min_periods > 1:
+        nobs = np.cumsum(~np.isnan(x), axis=1)
+        out[nobs < min_periods] = np.nan
+    return out
+
+# ==========================================
+# API
+# ==========================================
+
+def ewm(x, spans, adjust=False):
+    """EWM ze span (alpha = 2 / (span + 1)), jak Series.ewm(span=..., adjust=...).mean()."""
+    spans = _lengths(spans)
+    return _ewm(_rows(x, len(spans)), 2.0 / (spans + 1.0), adjust=adjust)
+
+def rma(x, lengths):
+    """Wilder (RMA) - pandas_ta.rma: ewm(alpha=1/length, adjust=False)."""
+    lengths = _lengths(lengths)
+    return _ewm(_rows(x, len(lengths)), 1.0 / lengths, adjust=False)
+
+def rsi(close, lengths, scalar=100.0):
+    """RSI z wygładzaniem Wildera - pandas_ta.rsi (mamode='rma')."""
+    lengths = _lengths(lengths)
+    change = _diff(np.asarray(close, dtype=float))
+    positive = np.where(change < 0, 0.0, change)
+    negative = np.where(change > 0, 0.0, change)
+    pos_avg = rma(positive, lengths)
+    neg_avg = rma(negative, lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return scalar * pos_avg / (pos_avg + np.abs(neg_avg))
+
+def true_range(high, low, close, prenan=False):
+    """True Range - pandas_ta.true_range (max z |H-L|, |H-C_1|, |C_1-L| z pominięciem NaN)."""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    hl = high - low
+    if np.any(hl == 0):
+        hl = hl + np.finfo(float).eps  # pandas_ta.non_zero_range
+    prev_close = np.r_[np.nan, close[:-1]]
+    tr = np.fmax(np.fmax(np.abs(hl), np.abs(high - prev_close)), np.abs(prev_close - low))
+    if prenan:
+        tr[:1] = np.nan
+    return tr
+
+def atr(high, low, close, lengths, presma=True, prenan=False):
+    """
+    ATR - pandas_ta.atr (mamode='rma'). presma: pierwsza wartość = SMA z TR
+    (domyślne w pandas_ta 0.4; starsze 0.3.x liczyły bez tego: presma=False, prenan=True).
+    """
+    lengths = _lengths(lengths)
+    tr = true_range(high, low, close, prenan=prenan)
+    rows = np.tile(tr, (len(lengths), 1))
+    if presma:
+        for i, length in enumerate(lengths):
+            sma = np.nanmean(tr[:length])
+            rows[i, :length - 1] = np.nan
+            rows[i, length - 1] = sma
+    return _ewm(rows, 1.0 / lengths, adjust=False)
+
+def _window_sum(x, weights):
+    """Suma ważona w oknie (wartości od indeksu len(weights)-1) - splot, pamięć O(N)."""
+    return np.convolve(x, weights[::-1], mode='valid')
+
+def rolling_std(x, lengths, ddof=1):
+    """
+    Odchylenie standardowe w oknie - Series.rolling(length).std() (algorytm online pandas,
+    O(N) czasu i pamięci; ten sam co w dawnej implementacji Inertia).
+    """
+    lengths = _lengths(lengths)
+    x = _rows(x, len(lengths))
+    out = np.full(x.shape, np.nan)
+    for i, length in enumerate(lengths):
+        if length <= x.shape[1]:
+            out[i] = pd.Series(x[i]).rolling(int(length)).std(ddof=ddof).to_numpy()
+    return out
+
+def linreg(x, lengths):
+    """
+    Regresja liniowa w oknie (wartość dopasowania na końcu okna) - pandas_ta.linreg,
+    x = 1..length. Sumy okien splotem (bez macierzy N x length).
+    """
+    lengths = _lengths(lengths)
+    x = _rows(x, len(lengths))
+    out = np.full(x.shape, np.nan)
+    for i, length in enumerate(lengths):
+        if length > x.shape[1]:
+            continue
+        xs = np.arange(1, length + 1, dtype=float)
+        x_sum = 0.5 * length * (length + 1)
+        x2_sum = x_sum * (2 * length + 1) / 3
+        divisor = length * x2_sum - x_sum * x_sum
+        y_sum = _window_sum(x[i], np.ones(length))
+        xy_sum = _window_sum(x[i], xs)
+        m = (length * xy_sum - x_sum * y_sum) / divisor
+        b = (y_sum * x2_sum - x_sum * xy_sum) / divisor
+        out[i, length - 1:] = m * length + b
+    return out
+
+# --- DORSEY INERTIA ---
+
+def rv_idi(src, stdev_len=21, smooth_rv=14):
+    """Relative Volatility Index (wersja Dorsey) - jak rv_idi_original w data_loader."""
+    src = np.asarray(src, dtype=float)
+    stdev = rolling_std(src, stdev_len)[0]
+    up_mask = _diff(src) >= 0
+    up_source = np.where(up_mask, stdev, 0.0)
+    down_source = np.where(~up_mask, stdev, 0.0)
+    up_sum, down_sum = ewm(np.vstack([up_source, down_source]), [smooth_rv, smooth_rv])
+    denom = up_sum + down_sum
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rvi = np.where(denom != 0, 100 * up_sum / denom, np.nan)
+    return np.where(np.isnan(rvi), 50.0, rvi)
+
+def dorsey_inertia(high, low, stdev_len=21, smooth_rv=14, smooth_di=14):
+    """Dorsey Inertia: linreg ze średniej RVI z High i Low (NaN na rozbiegu linreg)."""
+    rv_avg = (rv_idi(high, stdev_len, smooth_rv) + rv_idi(low, stdev_len, smooth_rv)) / 2
+    return linreg(rv_avg, smooth_di)[0]
+
+
+# ==========================================
+# ZGODNOŚĆ Z REFERENCJAMI (pandas / pandas_ta)
+# ==========================================
+
+def _rma_pandas(series, length, presma=False):
+    """pandas_ta.rma (opcjonalnie z SMA na starcie jak w pandas_ta.atr 0.4) na samym pandas."""
+    if presma:
+        series = series.copy()
+        sma = series.iloc[:length].mean()
+        series.iloc[:length - 1] = np.nan
+        series.iloc[length - 1] = sma
+    return series.ewm(alpha=1.0 / length, adjust=False).mean()
+
+def _linreg_pandas(series, length):
+    xs = np.arange(1, length + 1, dtype=float)
+    return series.rolling(length).apply(lambda w: np.polyval(np.polyfit(xs, w, 1), length), raw=True)
+
+def _dorsey_inertia_pandas(high, low, stdev_len=21, smooth_rv=14, smooth_di=14):
+    """Referencja: dawna implementacja Inertia (pandas), linreg przez np.polyfit."""
+    def rv(src):
+        stdev = src.rolling(window=stdev_len).std()
+        up_mask = src.diff() >= 0
+        up_source = pd.Series(0.0, index=src.index)
+        down_source = pd.Series(0.0, index=src.index)
+        up_source[up_mask] = stdev[up_mask]
+        down_source[~up_mask] = stdev[~up_mask]
+        up_sum = up_source.ewm(span=smooth_rv, adjust=False).mean()
+        down_sum = down_source.ewm(span=smooth_rv, adjust=False).mean()
+        denom = up_sum + down_sum
+        return (100 * up_sum / denom.replace(0, np.nan)).fillna(50)
+
+    return _linreg_pandas((rv(high) + rv(low)) / 2, smooth_di)
+
+def _pandas_refs(high, low, close, lengths):
+    """Wzory pandas_ta (ścieżka bez TA-Lib, 0.4) odtworzone na pandas ewm/rolling."""
+    change = close.diff()
+    positive, negative = change.clip(lower=0), change.clip(upper=0)
+
+    hl = high - low
+    if (hl == 0).any():
+        hl = hl + np.finfo(float).eps
+    prev_close = close.shift(1)
+    tr = pd.concat([hl.abs(), (high - prev_close).abs(), (prev_close - low).abs()], axis=1).max(axis=1)
+
+    def rsi_ref(n):
+        pos, neg = _rma_pandas(positive, n), _rma_pandas(negative, n)
+        return 100 * pos / (pos + neg.abs())
+
+    return {
+        'rsi': [rsi_ref(n) for n in lengths],
+        'atr': [_rma_pandas(tr, n, presma=True) for n in lengths],
+        'linreg': [_linreg_pandas(close, n) for n in lengths],
+        'rolling_std': [close.rolling(n).std() for n in lengths],
+        'ewm': [close.ewm(span=n, adjust=False).mean() for n in lengths],
+        'dorsey_inertia': [_dorsey_inertia_pandas(high, low)],
+    }
+
+def _pandas_ta_refs(high, low, close, lengths, ta):
+    return {
+        'rsi': [ta.rsi(close, length=n, talib=False) for n in lengths],
+        'atr': [ta.atr(high, low, close, length=n, talib=False) for n in lengths],
+        'linreg': [ta.linreg(close, length=n, talib=False) for n in lengths],
+    }
+
+def check_parity(df, lengths=(5, 7, 14), rtol=1e-9, atol=1e-9, with_pandas_ta=True):
+    """
+    Porównuje wskaźniki z referencjami na danych OHLC (kolumny High/Low/Close):
+    zawsze z wzorami pandas_ta odtworzonymi na pandas (ewm / rolling), a gdy pandas_ta
+    jest zainstalowane - także z nim samym. Zwraca dict 'referencja:nazwa' -> maks. różnica;
+    rzuca AssertionError przy rozbieżności.
+    """
+    high, low, close = (df[c].astype(float).reset_index(drop=True) for c in ('High', 'Low', 'Close'))
+    lengths = list(lengths)
+    ours = {
+        'rsi': rsi(close, lengths),
+        'atr': atr(high, low, close, lengths),
+        'linreg': linreg(close, lengths),
+        'rolling_std': rolling_std(close, lengths),
+        'ewm': ewm(close, lengths),
+        'dorsey_inertia': dorsey_inertia(high, low)[None, :],
+    }
+
+    references = {'pandas': _pandas_refs(high, low, close, lengths)}
+    if with_pandas_ta:
+        try:
+            import pandas_ta as ta
+            # Starsze pandas_ta (0.3.x) liczyły ATR bez SMA na starcie - tam ATR pomijamy
+            refs = _pandas_ta_refs(high, low, close, lengths, ta)
+            if str(getattr(ta, 'version', '0.4')).startswith('0.3'):
+                del refs['atr']
+            references['pandas_ta'] = refs
+        except ImportError:
+            pass
+
+    report = {}
+    for source, refs in references.items():
+        for name, series in refs.items():
+            ref = np.vstack([r.to_numpy(dtype=float) for r in series])
+            # Regresja przez np.polyfit ma własny błąd zaokrągleń (~1e-10 przy cenach ~2000)
+            tol = 1e-7 if name in ('linreg', 'dorsey_inertia') else atol
+            np.testing.assert_allclose(ours[name], ref, rtol=rtol, atol=tol, equal_nan=True,
+                                       err_msg=f"{source}:{name}")
+            report[f"{source}:{name}"] = float(np.nanmax(np.abs(ours[name] - ref)))
+    return report
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        from data_loader import load_data_from_csv, resample_data
+        data = resample_data(load_data_from_csv(sys.argv[1]), '2min')
+    else:
+        rng = np.random.default_rng(0)
+        close = 2000 + np.cumsum(rng.normal(0, 0.5, 20000))
+        data = pd.DataFrame({'Close': close,
+                             'High': close + rng.random(len(close)),
+                             'Low': close - rng.random(len(close))})
+
+    t0 = time.time()
+    for name, err in check_parity(data).items():
+        print(f"✅ {name:28s} maks. różnica: {err:.2e}")
+    print(f"Zgodność OK ({len(data)} świec, {time.time() - t0:.1f}s)")
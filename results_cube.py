@@ -0,0 +1,187 @@
+import heapq
+import io
+import itertools
+import json
+import warnings
+import numpy as np
+import pandas as pd
+from common import atomic_write, plain
+
+# ==========================================
+# KOSTKA WYNIKÓW (N-WYMIAROWA) + TOP-K
+# ==========================================
+# Zamiast trzymać heatmapę (MultiIndex Series) zwycięzcy i wyrzucać resztę,
+# zbieramy wyniki całej siatki w gęstej tablicy float32 z nazwanymi osiami.
+# Zapis: <path>.npy (dane, do otwarcia przez mmap) + <path>.json (osie).
+
+def _box_sum(a, radius, axis):
+    """Suma w oknie [i-radius, i+radius] wzdłuż osi (przez cumsum, krawędzie przycięte)."""
+    n = a.shape[axis]
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (1, 0)
+    c = np.cumsum(np.pad(a, pad), axis=axis)
+    hi = np.minimum(np.arange(n) + radius + 1, n)
+    lo = np.maximum(np.arange(n) - radius, 0)
+    return np.take(c, hi, axis=axis) - np.take(c, lo, axis=axis)
+
+
+class ResultCube:
+    """
+    Gęsta kostka wyników: values[i_1, ..., i_n] dla osi (nazwa -> lista wartości).
+    Pola nieocenione = NaN.
+    """
+
+    def __init__(self, axes: dict, values=None, name='score'):
+        self.axes = {k: [plain(v) for v in vals] for k, vals in axes.items()}
+        self.name = name
+        shape = tuple(len(v) for v in self.axes.values())
+        if values is None:
+            values = np.full(shape, np.nan, dtype=np.float32)
+        assert values.shape == shape, f"Kształt {values.shape} != osie {shape}"
+        self.values = values
+
+    @classmethod
+    def from_grid(cls, name='score', **axes):
+        return cls({k: list(v) for k, v in axes.items()}, name=name)
+
+    @property
+    def names(self):
+        return list(self.axes)
+
+    def __repr__(self):
+        dims = ', '.join(f"{k}={len(v)}" for k, v in self.axes.items())
+        return f"<ResultCube '{self.name}' ({dims}), ocenione: {np.isfinite(self.values).sum()}/{self.values.size}>"
+
+    # --- ZAPIS WYNIKÓW ---
+
+    def _axis_pos(self, axis, value):
+        return self.axes[axis].index(plain(value))
+
+    def set(self, params: dict, value):
+        idx = tuple(self._axis_pos(k, params[k]) for k in self.names)
+        self.values[idx] = value
+
+    def fill_from_heatmap(self, heatmap: pd.Series, **fixed):
+        """
+        Wpisuje heatmapę z bt.optimize(return_heatmap=True) (wektorowo).
+        fixed: osie spoza siatki optymalizatora, np. rsi_len=7.
+        """
+        idx = []
+        for axis in self.names:
+            if axis in fixed:
+                idx.append(np.full(len(heatmap), self._axis_pos(axis, fixed[axis])))
+            else:
+                level = heatmap.index.get_level_values(axis)
+                pos = pd.Index(self.axes[axis]).get_indexer(level)
+                if (pos < 0).any():
+                    raise KeyError(f"Wartości osi '{axis}' spoza kostki: {set(level[pos < 0])}")
+                idx.append(pos)
+        self.values[tuple(idx)] = heatmap.to_numpy(dtype=np.float32)
+
+    # --- ZAPYTANIA ---
+
+    def sel(self, **fixed) -> 'ResultCube':
+        """Wycinek kostki przy ustalonych wartościach części osi (widok, bez kopii)."""
+        index = tuple(self._axis_pos(k, fixed[k]) if k in fixed else slice(None) for k in self.names)
+        axes = {k: v for k, v in self.axes.items() if k not in fixed}
+        return ResultCube(axes, self.values[index], name=self.name)
+
+    def project(self, keep, how='max') -> 'ResultCube':
+        """Rzut na osie keep (pozostałe redukowane przez max/mean/min)."""
+        reducer = {'max': np.nanmax, 'mean': np.nanmean, 'min': np.nanmin}[how]
+        drop = tuple(i for i, k in enumerate(self.names) if k not in keep)
+        with warnings.catch_warnings():
+            # nanmax/nanmean na samych NaN (nieocenione pola) - to normalne
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = reducer(self.values, axis=drop) if drop else self.values
+        axes = {k: v for k, v in self.axes.items() if k in keep}
+        cube = ResultCube(axes, np.asarray(values, dtype=np.float32), name=self.name)
+        # Kolejność osi jak w keep
+        order = [cube.names.index(k) for k in keep]
+        return ResultCube({k: cube.axes[k] for k in keep}, cube.values.transpose(order), name=self.name)
+
+    def to_frame(self, rows, cols, how='max') -> pd.DataFrame:
+        """Tabela 2D (np. do seaborn.heatmap): rzut na (rows, cols)."""
+        cube = self.project([rows, cols], how=how)
+        return pd.DataFrame(cube.values,
+                            index=pd.Index(cube.axes[rows], name=rows),
+                            columns=pd.Index(cube.axes[cols], name=cols))
+
+    def plateau(self, radius=1) -> 'ResultCube':
+        """
+        Średnia wyniku w sąsiedztwie +-radius kroków siatki na każdej osi.
+        Wysoka wartość = stabilne "płaskowyże", a nie pojedyncze piki.
+        """
+        finite = np.isfinite(self.values)
+        total = np.where(finite, self.values, 0.0).astype(np.float64)
+        count = finite.astype(np.float64)
+        for axis in range(self.values.ndim):
+            total = _box_sum(total, radius, axis)
+            count = _box_sum(count, radius, axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(finite, total / count, np.nan)
+        return ResultCube(self.axes, values.astype(np.float32), name=f"{self.name}_plateau{radius}")
+
+    def best(self):
+        """(parametry, wartość) dla maksimum kostki; (None, nan) gdy pusta."""
+        if not np.isfinite(self.values).any():
+            return None, np.nan
+        flat = np.nanargmax(self.values)
+        idx = np.unravel_index(flat, self.values.shape)
+        params = {k: self.axes[k][i] for k, i in zip(self.names, idx)}
+        return params, float(self.values[idx])
+
+    # --- ZAPIS / ODCZYT ---
+
+    def save(self, path):
+        # Atomowo: przerwany zapis nie zostawi uciętego .npy obok starego .json
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(self.values))
+        atomic_write(f"{path}.npy", buf.getvalue())
+        atomic_write(f"{path}.json", json.dumps({'name': self.name, 'axes': self.axes}).encode('utf-8'))
+
+    @classmethod
+    def load(cls, path, mmap=True) -> 'ResultCube':
+        with open(f"{path}.json", encoding='utf-8') as f:
+            meta = json.load(f)
+        values = np.load(f"{path}.npy", mmap_mode='r' if mmap else None)
+        return cls(meta['axes'], values, name=meta['name'])
+
+
+class TopK:
+    """
+    Strumieniowy ranking kombinacji siatki: trzyma tylko K najlepszych (score, params, stats).
+    Pamięć stała niezależnie od rozmiaru siatki. Pełne statystyki warto liczyć tylko
+    dla kombinacji, które wejdą do rankingu (accepts) - reszta to sam wynik z heatmapy.
+    """
+
+    def __init__(self, k=5):
+        self.k = k
+        self._heap = []
+        self._counter = itertools.count()  # rozstrzyga remisy (stats nie są porównywalne)
+
+    def accepts(self, score) -> bool:
+        """Czy wynik wszedłby teraz do rankingu."""
+        if score is None or not np.isfinite(score):
+            return False
+        return len(self._heap) < self.k or score > self._heap[0][0]
+
+    def push(self, score, params, stats=None):
+        if not self.accepts(score):
+            return
+        item = (score, next(self._counter), params, stats)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heapreplace(self._heap, item)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def items(self):
+        """Lista (score, params, stats) od najlepszego."""
+        return [(s, p, st) for s, _, p, st in sorted(self._heap, key=lambda x: (-x[0], x[1]))]
+
+    def best(self):
+        items = self.items()
+        return items[0] if items else (None, None, None)
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+from scoring import MIN_TRADES, score_formula, trades_frame
+
+# ==========================================
+# MONTE CARLO / BOOTSTRAP NA LIŚCIE TRANSAKCJI
+# ==========================================
+# Zamiast tysięcy ponownych backtestów mieszamy gotową listę PnL transakcji
+# (stats._trades) w paczkach tablic numpy: (ścieżki x transakcje).
+
+METHODS = ('shuffle', 'bootstrap', 'block', 'skip')
+
+def trades_pnl(stats) -> np.ndarray:
+    """
+    Wyciąga PnL transakcji z wyniku bt.run() (lub z gotowego DataFrame / kolumn z puli).
+    """
+    trades = trades_frame(stats)
+    if trades is None or len(trades) == 0:
+        return np.empty(0)
+    return trades['PnL'].to_numpy(dtype=float)
+
+def _resample_batch(pnl, n_paths, method, rng, block_size, skip_prob):
+    """
+    Zwraca macierz (n_paths, n) przemieszanych PnL oraz maskę transakcji wziętych do ścieżki.
+    """
+    n = len(pnl)
+    taken = None
+
+    if method == 'shuffle':
+        # Ta sama lista, inna kolejność -> zmienia się tylko drawdown
+        paths = rng.permuted(np.tile(pnl, (n_paths, 1)), axis=1)
+    elif method == 'bootstrap':
+        paths = pnl[rng.integers(0, n, size=(n_paths, n))]
+    elif method == 'block':
+        # Bootstrap blokowy (cykliczny) - zachowuje serie zysków/strat
+        block_size = max(1, min(int(block_size), n))
+        n_blocks = -(-n // block_size)
+        starts = rng.integers(0, n, size=(n_paths, n_blocks, 1))
+        idx = (starts + np.arange(block_size)) % n
+        paths = pnl[idx.reshape(n_paths, -1)[:, :n]]
+    elif method == 'skip':
+        # Losowo pomijane transakcje (np. brak wejścia przez poślizg/awarię)
+        taken = rng.random((n_paths, n)) >= skip_prob
+        paths = np.where(taken, pnl, 0.0)
+    else:
+        raise ValueError(f"Nieznana metoda Monte Carlo: {method}. Dostępne: {METHODS}")
+
+    if taken is None:
+        taken = np.ones(paths.shape, dtype=bool)
+    return paths, taken
+
+def monte_carlo(pnl, n_paths=10000, method='bootstrap', cash=100000,
+                block_size=10, skip_prob=0.1, seed=42, batch_size=4096):
+    """
+    Symulacja Monte Carlo na liście PnL transakcji.
+    Zwraca dict tablic (po jednej wartości na ścieżkę):
+    'final_equity', 'max_drawdown' [% , dodatni], 'win_rate' [%], 'trades'.
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    out = {k: np.empty(n_paths) for k in ('final_equity', 'max_drawdown', 'win_rate', 'trades')}
+    if len(pnl) == 0:
+        out['final_equity'][:] = cash
+        out['max_drawdown'][:] = 0.0
+        out['win_rate'][:] = np.nan
+        out['trades'][:] = 0
+        return out
+
+    # Paczki ścieżek - pamięć stała niezależnie od n_paths
+    for lo in range(0, n_paths, batch_size):
+        hi = min(lo + batch_size, n_paths)
+        paths, taken = _resample_batch(pnl, hi - lo, method, rng, block_size, skip_prob)
+
+        equity = cash + np.cumsum(paths, axis=1)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), cash)
+        drawdown = (peak - equity) / peak
+
+        n_taken = taken.sum(axis=1)
+        wins = ((paths > 0) & taken).sum(axis=1)
+
+        out['final_equity'][lo:hi] = equity[:, -1]
+        out['max_drawdown'][lo:hi] = drawdown.max(axis=1) * 100
+        out['trades'][lo:hi] = n_taken
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out['win_rate'][lo:hi] = np.where(n_taken > 0, wins / n_taken * 100, np.nan)
+
+    return out
+
+def summarize(result, quantiles=(5, 25, 50, 75, 95)) -> pd.DataFrame:
+    """
+    Tabela kwantyli (przedziały ufności) dla wyniku monte_carlo().
+    """
+    rows = {}
+    for key, values in result.items():
+        rows[key] = {f"p{q}": np.nanpercentile(values, q) for q in quantiles}
+        rows[key]['mean'] = np.nanmean(values)
+    return pd.DataFrame(rows).T
+
+def robustness_report(stats, n_paths=20000, cash=100000, methods=METHODS, **kwargs) -> pd.DataFrame:
+    """
+    Raport dla jednego wyniku backtestu: wszystkie metody, jedna tabela.
+    """
+    pnl = trades_pnl(stats)
+    frames = []
+    for method in methods:
+        table = summarize(monte_carlo(pnl, n_paths=n_paths, method=method, cash=cash, **kwargs))
+        table.index = pd.MultiIndex.from_product([[method], table.index], names=['method', 'metric'])
+        frames.append(table)
+    return pd.concat(frames)
+
+# ==========================================
+# FUNKCJA OCENY DLA OPTYMALIZATORÓW
+# ==========================================
+
+def make_mc_score(n_paths=2000, quantile=5, min_trades=MIN_TRADES, method='bootstrap', seed=42):
+    """
+    Tworzy funkcję oceny (do maximize=) - dolny kwantyl wzoru optim_score
+    (nadwyżka WinRate nad 50% * sqrt(transakcji)) po bootstrapie transakcji.
+    Strategia z szczęśliwą, pojedynczą ścieżką dostaje niższą ocenę.
+    """
+    def mc_optim_score(stats):
+        pnl = trades_pnl(stats)
+        if len(pnl) < min_trades:
+            return -1.0
+        res = monte_carlo(pnl, n_paths=n_paths, method=method, seed=seed)
+        scores = score_formula(res['win_rate'], res['trades'], min_trades)
+        return float(np.nanpercentile(scores, quantile))
+
+    return mc_optim_score
+
+def make_mc_equity_score(n_paths=2000, quantile=5, cash=100000, method='bootstrap', seed=42):
+    """
+    Funkcja oceny - dolny kwantyl końcowego kapitału (zamiennik 'Equity Final [$]').
+    """
+    def mc_equity_score(stats):
+        pnl = trades_pnl(stats)
+        if len(pnl) == 0:
+            return float(cash)
+        res = monte_carlo(pnl, n_paths=n_paths, method=method, cash=cash, seed=seed)
+        return float(np.percentile(res['final_equity'], quantile))
+
+    return mc_equity_score
+
+# Gotowa instancja do wskazania po nazwie ('robustness:mc_equity_score'), np. dla workerów
+mc_equity_score = make_mc_equity_score()
+
+def rerank_top(bt, heatmap, objective, top_k=20):
+    """
+    bt.optimize() zwraca statystyki bez listy transakcji, więc ocena Monte Carlo
+    nie może działać wewnątrz siatki. Bierzemy top_k kombinacji z heatmapy
+    (np. wg optim_score), uruchamiamy je ponownie i wybieramy najlepszą wg objective.
+    Zwraca (stats, score) lub (None, -inf), gdy heatmapa jest pusta.
+    """
+    best_stats, best_score = None, -np.inf
+    candidates = heatmap.dropna().sort_values(ascending=False).head(top_k)
+    for combo in candidates.index:
+        values = combo if isinstance(combo, tuple) else (combo,)
+        stats = bt.run(**dict(zip(heatmap.index.names, values)))
+        score = objective(stats)
+        if score > best_score:
+            best_stats, best_score = stats, score
+    return best_stats, best_score
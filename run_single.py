@@ -16,6 +16,7 @@ else:
 from backtesting import Backtest
 from strategies import Strategy2xRSI_Dorsey
 from data_loader import prepare_data_with_indicators
+from day_cube import DayCube, atr_regimes
 import config
 import matplotlib.pyplot as plt
 
@@ -45,7 +46,8 @@ def run_single_test():
 
     # 1. Przygotowanie danych (Obliczenie wskaźników)
     # Ważne: Musimy podać RSI_LEN tutaj, bo to wpływa na budowę kolumn
-    data = prepare_data_with_indicators(PATH_2024, rsi_len=BEST_RSI_LEN)
+    data = prepare_data_with_indicators(PATH_2024, ltf_res=config.LTF, htf_res=config.HTF,
+                                        rsi_len=BEST_RSI_LEN, intrabar=config.INTRABAR_RESOLUTION)
     
     if data is None: return
 
@@ -80,6 +82,15 @@ def run_single_test():
     print("       WYNIK WERYFIKACJI (2024)       ")
     print("="*40)
     print(stats)
+
+    # 4b. Rozbicie na miesiące i reżimy zmienności (z dziennych agregatów - bez ponownych backtestów)
+    cube = DayCube.from_stats({'best': stats}, cash=config.CASH)
+    columns = ['net_profit', 'trades', 'win_rate', 'max_drawdown']
+    print("\n📅 Wynik per miesiąc:")
+    print(cube.by_period('M').xs('best', level='key')[columns].round(2).to_string())
+    print("   ℹ️ max_drawdown to górne oszacowanie (z dziennych max/min kapitału, bez kolejności w ciągu dnia)")
+    print("\n🌡️ Wynik per reżim ATR (Q1 = najspokojniejsze dni):")
+    print(cube.by_regime(atr_regimes(data)).xs('best', level='key')[['net_profit', 'trades', 'win_rate', 'days']].round(2).to_string())
     
     # 5. Wykresy
     try:
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# FUNKCJA OCENY (SCORE) I LISTY TRANSAKCJI
+# ==========================================
+# Jedno miejsce na wzór optim_score: optymalizator (backtester), pula / kolejka
+# ('scoring:optim_score'), przeliczenie kosztów (costs), kostka dni (day_cube)
+# i Monte Carlo (robustness) liczą ocenę tą samą funkcją.
+
+MIN_TRADES = 30  # Poniżej - szum statystyczny, ocena -1
+
+TRADE_COLUMNS = ('Size', 'EntryPrice', 'ExitPrice', 'SL', 'TP', 'PnL', 'EntryTime', 'ExitTime')
+
+def score_formula(win_rate, trades, min_trades=MIN_TRADES):
+    """
+    Wzór optim_score na tablicach (np. listy x scenariusze kosztów, zestawy x dni).
+    Wzór: Nadwyżka WinRate nad 50% * Pierwiastek z liczby transakcji
+    (Używamy pierwiastka, aby 1000 transakcji nie dominowało wyniku nad jakością sygnału)
+    """
+    win_rate = np.asarray(win_rate, dtype=float)
+    trades = np.asarray(trades, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.where(trades < min_trades, -1.0, (win_rate - 50) * np.sqrt(trades))
+
+def optim_score(stats):
+    """
+    Ocenia jakość strategii.
+    Cel: Wysoki Win Rate (>50%) poparty dużą liczbą transakcji.
+    """
+    win_rate = stats['Win Rate [%]']
+    trades = stats['# Trades']
+
+    # FILTR: Odrzucamy strategie z małą liczbą transakcji (szum statystyczny)
+    if trades < MIN_TRADES:
+        return -1.0
+
+    return (win_rate - 50) * np.sqrt(trades)
+
+def trade_columns(stats) -> dict:
+    """Lista transakcji bt.run() w formie kolumnowej do JSON (wyniki workerów kolejki / puli)."""
+    trades = stats['_trades']
+    out = {c: trades[c].to_numpy(dtype=float).tolist() for c in TRADE_COLUMNS if not c.endswith('Time')}
+    out.update({c: trades[c].astype(str).tolist() for c in ('EntryTime', 'ExitTime')})
+    return out
+
+def trades_frame(item) -> pd.DataFrame:
+    """Wynik bt.run(), gotowy DataFrame albo kolumny z trade_columns() -> DataFrame transakcji."""
+    if isinstance(item, pd.DataFrame):
+        return item
+    if isinstance(item, dict):
+        trades = pd.DataFrame({c: item[c] for c in TRADE_COLUMNS}, columns=list(TRADE_COLUMNS))
+        for c in ('EntryTime', 'ExitTime'):
+            trades[c] = pd.to_datetime(trades[c])
+        return trades
+    if '_trades' not in item:
+        # bt.optimize() obcina pola '_...' w wynikach z procesów - listy transakcji dają
+        # bt.run(), rerank_top() albo pula / kolejka z trades=True
+        raise KeyError("Wynik nie zawiera '_trades' (wynik z bt.optimize?). "
+                       "Potrzebny pełny bt.run() albo wyniki puli / kolejki z trades=True.")
+    return item['_trades']
@@ -0,0 +1,187 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from data_loader import has_intrabar
+from distributed import evaluate_chunk
+from common import grid_combinations
+
+# ==========================================
+# WSPÓLNA PAMIĘĆ DLA PROCESÓW OPTYMALIZACJI
+# ==========================================
+# Przygotowany DataFrame (indeks + kolumny, w tym dane intrabar Raw_*) trafia raz do
+# jednego bloku pamięci: nazwany segment shared memory albo plik (memmap).
+# Procesy dostają tylko mały uchwyt (nazwa + układ kolumn) i podpinają widoki
+# numpy tylko do odczytu - bez picklowania danych do każdego workera (spawn/Windows).
+
+ALIGN = 64  # wyrównanie kolumn w buforze [B]
+
+# kind: 'shm' / 'file', name: nazwa segmentu lub ścieżka pliku
+# index: (nazwa, dtype, offset), columns: [(nazwa, dtype, offset)]
+SharedHandle = namedtuple('SharedHandle', ['kind', 'name', 'size', 'n_rows', 'index', 'columns'])
+
+_ATTACHED = {}  # nazwa -> (obiekt bufora, dane) - widoki żyją tak długo jak bufor
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def _layout(arrays):
+    """Offsety kolejnych tablic w buforze + rozmiar całości."""
+    offsets, pos = [], 0
+    for arr in arrays:
+        offsets.append(pos)
+        pos = _aligned(pos + arr.nbytes)
+    return offsets, max(pos, 1)
+
+def _arrays_of(data: pd.DataFrame):
+    index = data.index.values
+    columns = [np.ascontiguousarray(data[col].to_numpy()) for col in data.columns]
+    return index, columns
+
+def _copy_in(buf, arrays, offsets):
+    for arr, off in zip(arrays, offsets):
+        np.frombuffer(buf, dtype=arr.dtype, count=arr.size, offset=off)[:] = arr.ravel()
+
+
+class SharedDataset:
+    """
+    Właściciel bloku danych. Użycie:
+
+        with SharedDataset(data) as handle:
+            ...  # handle przekazujemy do procesów -> attach(handle)
+
+    path=None: nazwany segment shared memory (zwalniany przy wyjściu),
+    path='plik.bin': plik mapowany w pamięć (zostaje na dysku, przydatny np. na RAM-dysku).
+    """
+
+    def __init__(self, data: pd.DataFrame, path=None):
+        if data.index.tz is not None:
+            raise ValueError("SharedDataset: indeks ze strefą czasową - najpierw tz_localize(None)")
+        index, columns = _arrays_of(data)
+        offsets, size = _layout([index] + columns)
+
+        if path is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            buf, kind, name = self._shm.buf, 'shm', self._shm.name
+        else:
+            self._shm = None
+            buf = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+            kind, name = 'file', os.path.abspath(path)
+        _copy_in(buf, [index] + columns, offsets)
+        if kind == 'file':
+            buf.flush()
+            del buf
+
+        self.handle = SharedHandle(
+            kind=kind, name=name, size=size, n_rows=len(data),
+            index=(data.index.name, index.dtype.str, offsets[0]),
+            columns=[(col, arr.dtype.str, off) for col, arr, off in zip(data.columns, columns, offsets[1:])],
+        )
+
+    def close(self):
+        if self._shm is not None:
+            _ATTACHED.pop(self._shm.name, None)
+            try:
+                self._shm.close()
+            except BufferError:
+                pass  # Widoki z attach() w tym procesie jeszcze żyją - mapowanie zniknie z nimi
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self.handle
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(handle: SharedHandle):
+    """
+    Uchwyt -> DataFrame na widokach bufora (bez kopii, tylko do odczytu).
+    Kolejne wywołania w tym samym procesie zwracają ten sam obiekt.
+    """
+    if handle.name in _ATTACHED:
+        return _ATTACHED[handle.name][1]
+
+    if handle.kind == 'shm':
+        # track=False: segment należy do procesu publikującego (Python 3.13+)
+        try:
+            owner = shared_memory.SharedMemory(name=handle.name, track=False)
+        except TypeError:
+            owner = shared_memory.SharedMemory(name=handle.name)
+        buf = owner.buf
+    else:
+        owner = buf = np.memmap(handle.name, dtype=np.uint8, mode='r', shape=(handle.size,))
+
+    def view(dtype, offset):
+        arr = np.frombuffer(buf, dtype=np.dtype(dtype), count=handle.n_rows, offset=offset)
+        arr.flags.writeable = False
+        return arr
+
+    index_name, index_dtype, index_offset = handle.index
+    index = pd.DatetimeIndex(view(index_dtype, index_offset), copy=False, name=index_name)
+    data = pd.DataFrame({col: view(dtype, off) for col, dtype, off in handle.columns}, index=index, copy=False)
+
+    _ATTACHED[handle.name] = (owner, data)
+    return data
+
+
+# ==========================================
+# PULA PROCESÓW NA WSPÓLNYCH DANYCH
+# ==========================================
+
+_WORKER = {}
+
+def _init_worker(handle):
+    _WORKER['data'] = attach(handle)
+
+def _run_chunk(task):
+    return evaluate_chunk(_WORKER['data'], task)
+
+
+class SharedGridPool:
+    """
+    Siatka parametrów liczona w N procesach (działa też przy spawn / Windows).
+    Dane publikowane raz do wspólnej pamięci; pula startuje raz i obsługuje
+    kolejne okna WFO - zadanie to tylko okno wierszy + paczka kombinacji.
+    Wyniki w formacie distributed.collect() (wybór przez distributed.best_params).
+    """
+
+    def __init__(self, data: pd.DataFrame, workers=None, path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.intrabar = has_intrabar(data)
+        self._dataset = SharedDataset(data, path=path)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self._dataset.handle,))
+
+    def run(self, param_grid, strategy, window=None, maximize='Equity Final [$]', bt_kwargs=None, chunk_size=None,
+            daily=False, trades=False):
+        """
+        strategy / maximize: 'modul:atrybut' (maximize może też być nazwą kolumny statystyk).
+        window: lista zakresów wierszy [(start, end), ...] lub None = całość.
+        daily=True: kolumna 'daily' z agregatami dziennymi (day_cube.DayCube.from_results).
+        trades=True: kolumna 'trade_list' z listą transakcji (costs.reprice).
+        Zwraca (job, results) jak submit_grid + collect.
+        """
+        combos = grid_combinations(param_grid)
+        chunk_size = chunk_size or max(1, len(combos) // (self.workers * 4))
+        spec = {'window': window, 'maximize': maximize, 'strategy': strategy, 'bt_kwargs': bt_kwargs or {},
+                'daily': daily, 'trades': trades, 'intrabar': self.intrabar}
+        tasks = [dict(spec, first=lo, params=combos[lo:lo + chunk_size])
+                 for lo in range(0, len(combos), chunk_size)]
+
+        rows = [row for chunk in self._pool.map(_run_chunk, tasks) for row in chunk]
+        results = pd.DataFrame(combos).join(pd.DataFrame(rows).set_index('combo').sort_index())
+        return {'combos': combos}, results
+
+    def close(self):
+        self._pool.shutdown()
+        self._dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,150 @@
+import time
+import numpy as np
+import pandas as pd
+from strategies import Strategy2xRSI_Dorsey, get_dorsey_inertia
+from common import grid_combinations
+
+# ==========================================
+# LEJEK SYGNAŁÓW (DIAGNOSTYKA BEZ BACKTESTU)
+# ==========================================
+# Warunki z Strategy2xRSI_Dorsey.next() jako maski na całej historii naraz,
+# w tej samej kolejności co w next():
+#
+#   close_all -> session -> atr -> htf -> ltf_cross -> inertia
+#
+# Dla każdego etapu liczymy świece, które jeszcze przechodzą, oraz kandydatów
+# na wejście (świece z przecięciem RSI LTF - wyzwalaczem sygnału), które
+# zostały. Warunek "brak otwartej pozycji" zależy od przebiegu transakcji -
+# maski go nie odtworzą, więc 'signals' to górna granica liczby wejść.
+#
+# Maski cząstkowe są cache'owane po parametrach, od których zależą - siatka
+# przelicza tylko to, co się zmienia (Inertia tylko dla nowych di_*).
+
+STAGES = ('close_all', 'session', 'atr', 'htf', 'ltf_cross', 'inertia')
+SIDES = ('long', 'short')
+
+def strategy_params(params=None, strategy=Strategy2xRSI_Dorsey) -> dict:
+    """Parametry strategii: domyślne z klasy nadpisane przez params (nieznane klucze pomijamy)."""
+    names = [k for k, v in vars(strategy).items() if not k.startswith('_') and isinstance(v, (int, float))]
+    out = {k: getattr(strategy, k) for k in names}
+    out.update({k: v for k, v in (params or {}).items() if k in out})
+    return out
+
+def _cached(cache, key, compute):
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+def _gates(data: pd.DataFrame, p: dict, cache: dict) -> dict:
+    """Maski bramek (True = świeca przechodzi); htf / ltf_cross / inertia jako pary (long, short)."""
+    arrays = _cached(cache, 'arrays', lambda: {
+        'hour': data.index.hour.to_numpy(),
+        'minute': data.index.minute.to_numpy(),
+        'close': data['Close'].to_numpy(dtype=float),
+        'atr': data['ATR'].to_numpy(dtype=float),
+        'rsi_htf': data['RSI_HTF'].to_numpy(dtype=float),
+        'rsi_ltf': data['RSI_LTF'].to_numpy(dtype=float),
+        # RSI_LTF[-2]; pierwsza świeca nie ma poprzedniej (next() zaczyna od drugiej)
+        'prev_rsi_ltf': np.concatenate([[np.nan], data['RSI_LTF'].to_numpy(dtype=float)[:-1]]),
+    })
+    hour, minute = arrays['hour'], arrays['minute']
+
+    def htf():
+        rsi = arrays['rsi_htf']
+        return rsi > 50 + p['rsi_delta_htf'], rsi < 50 - p['rsi_delta_htf']
+
+    def ltf_cross():
+        rsi, prev = arrays['rsi_ltf'], arrays['prev_rsi_ltf']
+        lr_up, lr_dn = 50 + p['rsi_delta_ltf'], 50 - p['rsi_delta_ltf']
+        return (prev < lr_dn) & (rsi >= lr_dn), (prev > lr_up) & (rsi <= lr_up)
+
+    di_key = ('di', p['di_stdev_len'], p['di_smooth_rv'], p['di_smooth_di'])
+    inertia = _cached(cache, di_key, lambda: get_dorsey_inertia(
+        data['High'].to_numpy(dtype=float), data['Low'].to_numpy(dtype=float),
+        p['di_stdev_len'], p['di_smooth_rv'], p['di_smooth_di']))
+
+    return {
+        'close_all': _cached(cache, ('close_all', p['close_all_hour'], p['close_all_minute']),
+                             lambda: ~((hour == p['close_all_hour']) & (minute >= p['close_all_minute']))),
+        'session': _cached(cache, ('session', p['session_start_hour'], p['session_end_hour']),
+                           lambda: (p['session_start_hour'] <= hour) & (hour < p['session_end_hour'])),
+        # Jak w next(): odpada tylko atr < próg (NaN ATR przechodzi)
+        'atr': _cached(cache, ('atr', p['atr_min_percent']),
+                       lambda: ~(arrays['atr'] < arrays['close'] * p['atr_min_percent'])),
+        'htf': _cached(cache, ('htf', p['rsi_delta_htf']), htf),
+        'ltf_cross': _cached(cache, ('ltf', p['rsi_delta_ltf']), ltf_cross),
+        'inertia': (inertia > p['di_level_long'], inertia < p['di_level_short']),
+    }
+
+def _side_masks(gates: dict, side: int) -> list:
+    return [gates[s] if isinstance(gates[s], np.ndarray) else gates[s][side] for s in STAGES]
+
+def signal_funnel(data: pd.DataFrame, params=None, strategy=Strategy2xRSI_Dorsey, cache=None) -> pd.DataFrame:
+    """
+    Lejek dla jednego zestawu parametrów. Wiersze: etapy ('start' + STAGES), kolumny per strona:
+      bars_*        - świece, które przeszły wszystkie bramki do tego etapu włącznie,
+      candidates_*  - przecięcia RSI LTF (kandydaci na wejście), które przeszły pozostałe bramki do tego etapu,
+      removed_*     - kandydaci odrzuceni na tym etapie,
+      alone_*       - kandydaci, których ten warunek odrzuca sam (niezależnie od reszty).
+    Ostatni wiersz ('inertia') to sygnały wejścia - górna granica liczby transakcji.
+    """
+    p = strategy_params(params, strategy)
+    gates = _gates(data, p, {} if cache is None else cache)
+    n = len(data)
+
+    table = {}
+    for side, name in enumerate(SIDES):
+        masks = _side_masks(gates, side)
+        cross = masks[STAGES.index('ltf_cross')]
+        alive = np.ones(n, dtype=bool)
+        alive[:1] = False  # next() nie jest wołane dla pierwszej świecy
+        bars, candidates, alone = [int(alive.sum())], [int((alive & cross).sum())], [0]
+        for mask in masks:
+            alive &= mask
+            bars.append(int(alive.sum()))
+            candidates.append(int((alive & cross).sum()))
+            alone.append(int((cross & ~mask).sum()))
+        table[f'bars_{name}'] = bars
+        table[f'candidates_{name}'] = candidates
+        table[f'removed_{name}'] = [0] + [a - b for a, b in zip(candidates, candidates[1:])]
+        table[f'alone_{name}'] = alone
+    return pd.DataFrame(table, index=pd.Index(('start',) + STAGES, name='stage'))
+
+def funnel_grid(data: pd.DataFrame, param_grid: dict, base_params=None, strategy=Strategy2xRSI_Dorsey) -> pd.DataFrame:
+    """
+    Lejek dla całej siatki (jak w bt.optimize: nazwa -> lista wartości).
+    Jeden wiersz na kombinację: kandydaci, odrzuceni per etap (obie strony razem),
+    sygnały long/short oraz 'blocker' - etap, który odrzucił najwięcej kandydatów.
+    """
+    cache = {}
+    rows = []
+    for combo in grid_combinations(param_grid):
+        funnel = signal_funnel(data, dict(base_params or {}, **combo), strategy, cache)
+        removed = funnel['removed_long'] + funnel['removed_short']
+        row = dict(combo, candidates=int(funnel.loc['start', 'candidates_long'] + funnel.loc['start', 'candidates_short']))
+        row.update({f'removed_{s}': int(removed[s]) for s in STAGES if s != 'ltf_cross'})
+        row['signals_long'] = int(funnel['candidates_long'].iloc[-1])
+        row['signals_short'] = int(funnel['candidates_short'].iloc[-1])
+        row['blocker'] = removed.drop(['start', 'ltf_cross']).idxmax() if removed.sum() else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def print_funnel(funnel: pd.DataFrame):
+    """Czytelny wydruk lejka jednego zestawu."""
+    for name in SIDES:
+        print(f"\n🔻 Lejek {name.upper()}:")
+        print(f"   {'etap':<10} {'świece':>10} {'kandydaci':>10} {'odrzuceni':>10} {'sam odrzuca':>12}")
+        for stage, r in funnel.iterrows():
+            print(f"   {stage:<10} {r[f'bars_{name}']:>10} {r[f'candidates_{name}']:>10} "
+                  f"{r[f'removed_{name}']:>10} {r[f'alone_{name}']:>12}")
+        print(f"   -> sygnały wejścia: {funnel[f'candidates_{name}'].iloc[-1]} (przed warunkiem 'brak pozycji')")
+
+if __name__ == '__main__':
+    import config
+    from data_loader import prepare_data_with_indicators
+
+    data = prepare_data_with_indicators(config.CSV_PATH, ltf_res=config.LTF, htf_res=config.HTF)
+    if data is not None:
+        t0 = time.perf_counter()
+        print_funnel(signal_funnel(data))
+        print(f"\n⏱️ Lejek policzony w {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,142 @@
+import itertools
+from collections import Counter, namedtuple
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# INDEKS DNI + PODZIAŁY TRAIN/TEST (WFO / CV)
+# ==========================================
+# Indeks dni liczony raz: dzień -> offset pierwszego wiersza. Każde okno to
+# wtedy zakres dni [d0, d1) -> data.iloc[offsets[d0]:offsets[d1]] (bez
+# data.loc[Timestamp:Timestamp] i arytmetyki pd.Timedelta w pętli).
+
+# train / test: listy zakresów dni [(d0, d1), ...] (CPCV daje zakresy nieciągłe)
+# groups: numery grup CPCV, po jednym na zakres test (rolling / anchored: None)
+Split = namedtuple('Split', ['train', 'test', 'groups'], defaults=[None])
+
+SCHEMES = ('rolling', 'anchored', 'cpcv')
+
+
+class DayIndex:
+    """
+    Mapa dzień -> offset wiersza dla posortowanego DatetimeIndex.
+    calendar=True: wszystkie dni kalendarzowe (okna w dniach jak pd.Timedelta(days=...)),
+    calendar=False: tylko dni z danymi (dni handlowe).
+    """
+
+    def __init__(self, index: pd.DatetimeIndex, calendar=True):
+        days_of_rows = index.normalize()
+        if calendar:
+            self.days = pd.date_range(days_of_rows[0], days_of_rows[-1], freq='D')
+        else:
+            self.days = days_of_rows.unique()
+        # offsets[d] = pierwszy wiersz dnia d, offsets[n_days] = len(index)
+        self.offsets = np.append(np.searchsorted(index.values, self.days.values, side='left'), len(index))
+
+    @property
+    def n_days(self):
+        return len(self.days)
+
+    def rows(self, d0, d1) -> slice:
+        return slice(int(self.offsets[d0]), int(self.offsets[d1]))
+
+    def n_rows(self, ranges) -> int:
+        return int(sum(self.offsets[d1] - self.offsets[d0] for d0, d1 in ranges))
+
+    def row_ranges(self, ranges):
+        """Zakresy dni -> zakresy wierszy [(start, stop), ...] (np. do zadań rozproszonych)."""
+        return [(int(self.offsets[d0]), int(self.offsets[d1])) for d0, d1 in ranges]
+
+    def take(self, data: pd.DataFrame, ranges) -> pd.DataFrame:
+        """Wycinek danych dla listy zakresów dni (jeden zakres = widok iloc, bez kopii)."""
+        if len(ranges) == 1:
+            return data.iloc[self.rows(*ranges[0])]
+        return pd.concat([data.iloc[self.rows(d0, d1)] for d0, d1 in ranges])
+
+    def label(self, d):
+        """Data dnia d (d == n_days -> dzień po ostatnim)."""
+        if d >= self.n_days:
+            return (self.days[-1] + pd.Timedelta(days=d - self.n_days + 1)).date()
+        return self.days[d].date()
+
+
+# --- GENERATORY PODZIAŁÓW (w jednostkach dni) ---
+
+def rolling_splits(n_days, train_days, test_days, step_days=None, embargo_days=0):
+    """Przesuwane okno: stała długość train, test zaraz po nim (+ embargo)."""
+    step = step_days or test_days
+    d = 0
+    while d + train_days + embargo_days + test_days <= n_days:
+        test_start = d + train_days + embargo_days
+        yield Split([(d, d + train_days)], [(test_start, test_start + test_days)])
+        d += step
+
+def anchored_splits(n_days, train_days, test_days, step_days=None, embargo_days=0):
+    """Okno zakotwiczone: train zawsze od początku danych i rośnie o step."""
+    step = step_days or test_days
+    train_end = train_days
+    while train_end + embargo_days + test_days <= n_days:
+        test_start = train_end + embargo_days
+        yield Split([(0, train_end)], [(test_start, test_start + test_days)])
+        train_end += step
+
+def _mask_to_ranges(mask):
+    """Maska dni -> lista ciągłych zakresów [(d0, d1), ...]."""
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return [(int(a), int(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+def combinatorial_purged_splits(n_days, n_groups=6, n_test_groups=2, purge_days=1, embargo_days=1):
+    """
+    Combinatorial Purged CV (de Prado): dni dzielimy na n_groups bloków,
+    każda kombinacja n_test_groups bloków to test. Z train usuwamy purge_days
+    przed każdym blokiem testowym i embargo_days po nim (przeciek informacji).
+    Test to osobny zakres na każdą grupę (także sąsiednie) - do składania ścieżek (cpcv_paths).
+    """
+    bounds = np.linspace(0, n_days, n_groups + 1).astype(int)
+    for test_groups in itertools.combinations(range(n_groups), n_test_groups):
+        test_mask = np.zeros(n_days, dtype=bool)
+        for g in test_groups:
+            test_mask[bounds[g]:bounds[g + 1]] = True
+
+        train_mask = ~test_mask
+        for d0, d1 in _mask_to_ranges(test_mask):
+            train_mask[max(0, d0 - purge_days):d0] = False
+            train_mask[d1:d1 + embargo_days] = False
+
+        test = [(int(bounds[g]), int(bounds[g + 1])) for g in test_groups]
+        yield Split(_mask_to_ranges(train_mask), test, list(test_groups))
+
+def cpcv_paths(splits):
+    """
+    Ścieżki backtestu CPCV: każda grupa jest testowana w C(N-1, k-1) podziałach,
+    j-te wystąpienie grupy (w kolejności podziałów) należy do ścieżki j. Pełna ścieżka
+    pokrywa każdą grupę dokładnie raz - to ciągły, rozłączny OOS, który można sumować.
+    Zwraca numery ścieżek dla bloków testowych: [[ścieżka bloku 0, ...], ...] (None poza CPCV).
+    """
+    seen = Counter()
+    paths = []
+    for split in splits:
+        if split.groups is None:
+            paths.append([None] * len(split.test))
+            continue
+        paths.append([seen[g] for g in split.groups])
+        seen.update(split.groups)
+    return paths
+
+def make_splits(scheme, day_index: DayIndex, min_train_rows=0, min_test_rows=0, **kwargs):
+    """
+    Lista podziałów dla schematu ('rolling' / 'anchored' / 'cpcv').
+    Okna z za małą liczbą świec odrzucamy z offsetów - zanim cokolwiek wytniemy.
+    """
+    generators = {
+        'rolling': rolling_splits,
+        'anchored': anchored_splits,
+        'cpcv': combinatorial_purged_splits,
+    }
+    if scheme not in generators:
+        raise ValueError(f"Nieznany schemat podziału: {scheme}. Dostępne: {SCHEMES}")
+
+    return [split for split in generators[scheme](day_index.n_days, **kwargs)
+            if day_index.n_rows(split.train) >= min_train_rows
+            and all(day_index.n_rows([t]) >= min_test_rows for t in split.test)]
@@ -1,37 +1,29 @@
 from backtesting import Strategy
-import pandas as pd
-import pandas_ta as ta
+import indicators as ind
 import numpy as np
 
-# --- FUNKCJA POMOCNICZA (BEZ ZMIAN) ---
+# --- FUNKCJA POMOCNICZA ---
 def get_dorsey_inertia(high, low, stdev_len, smooth_rv, smooth_di):
-    high_s = pd.Series(high)
-    low_s = pd.Series(low)
-    
-    def rv_idi(src):
-        stdev = src.rolling(window=int(stdev_len)).std()
-        change = src.diff()
-        up_mask = change >= 0
-        up_source = pd.Series(0.0, index=src.index)
-        down_source = pd.Series(0.0, index=src.index)
-        up_source[up_mask] = stdev[up_mask]
-        down_source[~up_mask] = stdev[~up_mask]
-        up_sum = up_source.ewm(span=int(smooth_rv), adjust=False).mean()
-        down_sum = down_source.ewm(span=int(smooth_rv), adjust=False).mean()
-        denom = up_sum + down_sum
-        rvi = 100 * up_sum / denom.replace(0, np.nan)
-        return rvi.fillna(50)
-
-    rvi_h = rv_idi(high_s)
-    rvi_l = rv_idi(low_s)
-    rv_avg = (rvi_h + rvi_l) / 2
-    
-    try:
-        inertia = ta.linreg(rv_avg, length=int(smooth_di))
-    except:
-        inertia = rv_avg
-        
-    return inertia.fillna(50).to_numpy()
+    inertia = ind.dorsey_inertia(high, low, int(stdev_len), int(smooth_rv), int(smooth_di))
+    return np.where(np.isnan(inertia), 50.0, inertia)
+
+
+# --- ROZSTRZYGANIE SL/TP W ŚWIECY (DRILL-DOWN 1-MIN) ---
+def intrabar_tp_first(h, l, is_long, sl, tp):
+    """
+    Sprawdza na danych 1-min jednej świecy (h, l - minuty po kolei, NaN = brak minuty),
+    czy TP padł przed SL. Gdy oba poziomy trafiła ta sama minuta - pesymistycznie zwraca False (SL).
+    """
+    if is_long:
+        sl_hit, tp_hit = l <= sl, h >= tp
+    else:
+        sl_hit, tp_hit = h >= sl, l <= tp
+
+    if not tp_hit.any():
+        return False
+    if not sl_hit.any():
+        return True
+    return np.argmax(tp_hit) < np.argmax(sl_hit)
 
 
 class Strategy2xRSI_Dorsey(Strategy):
@@ -71,8 +63,46 @@ class Strategy2xRSI_Dorsey(Strategy):
             self.di_smooth_rv, 
             self.di_smooth_di
         )
-        
+
+        # Dane 1-min świec (kolumny Raw_High_i / Raw_Low_i z prepare_data_with_indicators(..., intrabar=True)).
+        # Gdy są, niejednoznaczne świece (SL i TP w jednej) rozstrzygamy na minutach.
+        # W init() dane mają pełną długość - zapamiętujemy całe tablice (podgląd następnej świecy)
+        df = self.data.df
+        self._raw_high = df.filter(regex=r'^Raw_High_\d+$').to_numpy(dtype=float)
+        self._raw_low = df.filter(regex=r'^Raw_Low_\d+$').to_numpy(dtype=float)
+        self._intrabar = self._raw_high.shape[1] > 0
+        if self._intrabar:
+            self._bar_high = np.asarray(self.data.High)
+            self._bar_low = np.asarray(self.data.Low)
+
+    def _tp_first_next_bar(self, is_long, sl, tp):
+        """
+        Broker backtesting.py przy SL i TP w jednej świecy zawsze wybiera SL.
+        Zlecenia wykonują się na następnej świecy, więc sprawdzamy ją teraz:
+        tylko dla świec niejednoznacznych schodzimy do danych 1-min.
+        """
+        j = len(self.data)
+        if j >= len(self._bar_high):
+            return False
+
+        if is_long:
+            ambiguous = self._bar_low[j] <= sl and self._bar_high[j] >= tp
+        else:
+            ambiguous = self._bar_high[j] >= sl and self._bar_low[j] <= tp
+        if not ambiguous:
+            return False
+
+        return intrabar_tp_first(self._raw_high[j], self._raw_low[j], is_long, sl, tp)
+
     def next(self):
+        # 00. ROZSTRZYGNIĘCIE SL/TP DLA OTWARTYCH POZYCJI (1-MIN)
+        # Jeśli w następnej świecy TP padnie pierwszy, zdejmujemy SL - pozycję zamknie TP.
+        # Zlecenie wejścia zawsze ma SL: świecę wejścia broker rozstrzyga pesymistycznie (SL).
+        if self._intrabar:
+            for trade in self.trades:
+                if trade.sl and trade.tp and self._tp_first_next_bar(trade.is_long, trade.sl, trade.tp):
+                    trade.sl = None
+
         # 0. ZAMYKANIE DNIA
         current_time = self.data.index[-1]
         if current_time.hour == self.close_all_hour and current_time.minute >= self.close_all_minute: